@@ -0,0 +1,166 @@
+import asyncio
+import ssl
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from request import (
+    CHUNK_SIZE,
+    Body,
+    Decompressor,
+    Headers,
+    decode_body,
+    parse_header,
+    parse_statusline,
+    parse_url,
+    request_head,
+)
+
+
+class AsyncFetcher:
+    # Fetches documents concurrently on one event loop. At most
+    # `max_connections` requests are in flight overall and at most
+    # `max_per_host` to any one host; the rest wait their turn.
+    def __init__(
+        self,
+        max_connections: int = 16,
+        max_per_host: int = 4,
+        accept_encoding: bool = False,
+        chunk_size: int = CHUNK_SIZE,
+    ):
+        self.max_per_host = max_per_host
+        self.accept_encoding = accept_encoding
+        self.chunk_size = chunk_size
+        self.connections = asyncio.Semaphore(max_connections)
+        self.hosts: Dict[Tuple[str, int], asyncio.Semaphore] = {}
+        self.context: Optional[ssl.SSLContext] = None
+
+    async def fetch(self, url: str) -> Tuple[Headers, Body]:
+        scheme, host, port, path = parse_url(url)
+        host_limit = self.hosts.setdefault(
+            (host, port), asyncio.Semaphore(self.max_per_host)
+        )
+        # Waiting for a busy host must not hold one of the overall slots,
+        # or requests to other hosts queue behind it.
+        async with host_limit, self.connections:
+            if scheme == "https":
+                if self.context is None:
+                    self.context = ssl.create_default_context()
+                reader, writer = await asyncio.open_connection(
+                    host, port, ssl=self.context, server_hostname=host
+                )
+            else:
+                reader, writer = await asyncio.open_connection(host, port)
+            try:
+                writer.write(request_head("HTTP/1.0", host, path, self.accept_encoding))
+                await writer.drain()
+
+                version, status, explanation = parse_statusline(await reader.readline())
+                assert status == "200", "{}: {}".format(status, explanation)
+                headers = await read_headers(reader)
+
+                body = []
+                async for chunk in read_body(reader, headers, self.chunk_size):
+                    body.append(chunk)
+            finally:
+                writer.close()
+        return headers, decode_body(headers, b"".join(body))
+
+    async def fetch_all(
+        self, urls: List[str]
+    ) -> List[Tuple[Headers, Body] | BaseException]:
+        return await asyncio.gather(
+            *[self.fetch(url) for url in urls], return_exceptions=True
+        )
+
+
+def fetch_all(
+    urls: List[str],
+    max_connections: int = 16,
+    max_per_host: int = 4,
+    accept_encoding: bool = False,
+) -> List[Tuple[Headers, Body] | BaseException]:
+    async def run() -> List[Tuple[Headers, Body] | BaseException]:
+        fetcher = AsyncFetcher(max_connections, max_per_host, accept_encoding)
+        return await fetcher.fetch_all(urls)
+
+    return asyncio.run(run())
+
+
+async def read_headers(reader: asyncio.StreamReader) -> Headers:
+    headers: Headers = {}
+    while True:
+        line = await reader.readline()
+        if line in [b"\r\n", b"\n", b""]:
+            break
+        header, value = parse_header(line)
+        headers[header] = value
+    return headers
+
+
+async def read_body(
+    reader: asyncio.StreamReader, headers: Headers, chunk_size: int = CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    chunks: AsyncIterator[bytes]
+    if headers.get("transfer-encoding", "identity").lower() == "chunked":
+        chunks = read_chunked(reader, chunk_size)
+    elif "transfer-encoding" in headers:
+        raise AssertionError(
+            "Unsupported transfer-encoding {}".format(headers["transfer-encoding"])
+        )
+    elif "content-length" in headers:
+        chunks = read_length(reader, int(headers["content-length"]), chunk_size)
+    else:
+        chunks = read_length(reader, None, chunk_size)
+
+    encoding = headers.get("content-encoding", "identity").lower()
+    if encoding == "identity":
+        async for chunk in chunks:
+            yield chunk
+        return
+
+    decompressor = Decompressor(encoding, chunk_size)
+    async for chunk in chunks:
+        for data in decompressor.decompress(chunk):
+            yield data
+    data = decompressor.flush()
+    if data:
+        yield data
+
+
+async def read_length(
+    reader: asyncio.StreamReader, length: Optional[int], chunk_size: int = CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    while length is None or length > 0:
+        size = chunk_size if length is None else min(length, chunk_size)
+        data = await reader.read(size)
+        if not data:
+            assert length is None, "Connection closed with {} bytes left".format(length)
+            return
+        if length is not None:
+            length -= len(data)
+        yield data
+
+
+async def read_chunked(
+    reader: asyncio.StreamReader, chunk_size: int = CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    while True:
+        line = await reader.readline()
+        assert line, "Connection closed inside chunked body"
+        size = int(line.split(b";", 1)[0], 16)
+        if size == 0:
+            break
+        async for data in read_length(reader, size, chunk_size):
+            yield data
+        await reader.readline()
+    await read_headers(reader)
+
+
+if __name__ == "__main__":
+    import sys
+
+    for url, result in zip(sys.argv[1:], fetch_all(sys.argv[1:])):
+        if isinstance(result, BaseException):
+            print("{}: {}".format(url, result))
+        else:
+            headers, body = result
+            print("{}: {} characters".format(url, len(body)))
@@ -0,0 +1,198 @@
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from browser import WIDTH, DocumentLayout, DrawRect, DrawText
+from font import FontBackend, GlyphTableBackend, MonospaceBackend, set_backend
+from html_parser import HTMLParser
+from http_cache import HTTPCache
+from request import decode_body, request
+from snapshot import SnapshotCache
+
+CACHE: Optional[HTTPCache] = None
+SNAPSHOTS: Optional[SnapshotCache] = None
+CONNECT_TIMEOUT: Optional[float] = None
+
+
+def fetch(url: str) -> str:
+    if url.startswith("http://") or url.startswith("https://"):
+        if CACHE:
+            headers, body = CACHE.request(
+                url, accept_encoding=True, connect_timeout=CONNECT_TIMEOUT
+            )
+        else:
+            headers, body = request(
+                url, accept_encoding=True, connect_timeout=CONNECT_TIMEOUT
+            )
+        return body
+    if url.startswith("file://"):
+        url = url[len("file://") :]
+    with open(url, "rb") as f:
+        return decode_body({}, f.read())
+
+
+def serialize(cmd: DrawText | DrawRect) -> Dict[str, Any]:
+    if isinstance(cmd, DrawText):
+        size, weight, slant = cmd.font.key
+        return {
+            "type": "text",
+            "left": cmd.left,
+            "top": cmd.top,
+            "bottom": cmd.bottom,
+            "text": cmd.text,
+            "font": [size, weight, slant],
+        }
+    return {
+        "type": "rect",
+        "left": cmd.left,
+        "top": cmd.top,
+        "right": cmd.right,
+        "bottom": cmd.bottom,
+        "color": cmd.color,
+    }
+
+
+def render(url: str) -> Dict[str, Any]:
+    timings: Dict[str, float] = {}
+    try:
+        start = time.perf_counter()
+        body = fetch(url)
+        timings["fetch"] = time.perf_counter() - start
+
+        mark = time.perf_counter()
+        snapshot = SNAPSHOTS.load(body, WIDTH) if SNAPSHOTS else None
+        if snapshot:
+            height, display_list = snapshot
+            timings["snapshot"] = time.perf_counter() - mark
+        else:
+            nodes = HTMLParser(body).parse()
+            timings["parse"] = time.perf_counter() - mark
+
+            mark = time.perf_counter()
+            document = DocumentLayout(nodes)
+            document.layout()
+            timings["layout"] = time.perf_counter() - mark
+
+            mark = time.perf_counter()
+            display_list = []
+            document.paint(display_list)
+            height = document.height
+            timings["paint"] = time.perf_counter() - mark
+            if SNAPSHOTS:
+                SNAPSHOTS.store(body, WIDTH, height, display_list)
+        timings["total"] = time.perf_counter() - start
+    except Exception as e:
+        return {"url": url, "error": "{}: {}".format(type(e).__name__, e)}
+
+    return {
+        "url": url,
+        "height": height,
+        "timings": timings,
+        "display_list": [serialize(cmd) for cmd in display_list],
+    }
+
+
+def make_backend(name: str) -> FontBackend:
+    if name == "monospace":
+        return MonospaceBackend()
+    assert name.startswith("glyphs:"), "Unknown font backend {}".format(name)
+    return GlyphTableBackend.load(name[len("glyphs:") :])
+
+
+def init_worker(
+    backend: str,
+    cache: Optional[str] = None,
+    snapshots: Optional[str] = None,
+    connect_timeout: Optional[float] = None,
+) -> None:
+    global CACHE, SNAPSHOTS, CONNECT_TIMEOUT
+    set_backend(make_backend(backend))
+    CACHE = HTTPCache(cache) if cache else None
+    SNAPSHOTS = SnapshotCache(snapshots) if snapshots else None
+    CONNECT_TIMEOUT = connect_timeout
+
+
+def render_all(
+    urls: List[str],
+    backend: str = "monospace",
+    processes: Optional[int] = None,
+    cache: Optional[str] = None,
+    snapshots: Optional[str] = None,
+    connect_timeout: Optional[float] = None,
+) -> Iterator[Dict[str, Any]]:
+    with multiprocessing.Pool(
+        processes, init_worker, (backend, cache, snapshots, connect_timeout)
+    ) as pool:
+        yield from pool.imap(render, urls)
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(
+        description="Lay out pages without a display and write their display "
+        "lists as JSON Lines."
+    )
+    parser.add_argument("urls", nargs="*", help="URLs or local HTML files")
+    parser.add_argument(
+        "-i", "--input", help="file with one URL or path per line ('-' for stdin)"
+    )
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    parser.add_argument("-j", "--processes", type=int, help="worker processes")
+    parser.add_argument(
+        "--backend",
+        default="monospace",
+        help="font backend: 'monospace' or 'glyphs:<tables.json>'",
+    )
+    parser.add_argument(
+        "--cache", help="directory for an HTTP cache shared between runs"
+    )
+    parser.add_argument(
+        "--snapshots",
+        help="directory for laid-out pages, reused when the body is unchanged",
+    )
+    parser.add_argument(
+        "--connect-timeout",
+        type=float,
+        help="seconds to wait for each host to accept a connection",
+    )
+    args = parser.parse_args(argv)
+
+    urls = list(args.urls)
+    if args.input:
+        lines = sys.stdin if args.input == "-" else open(args.input)
+        urls += [line.strip() for line in lines if line.strip()]
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    start = time.perf_counter()
+    failed = 0
+    for result in render_all(
+        urls,
+        args.backend,
+        args.processes,
+        args.cache,
+        args.snapshots,
+        args.connect_timeout,
+    ):
+        out.write(json.dumps(result) + "\n")
+        if "error" in result:
+            failed += 1
+            print("{}: {}".format(result["url"], result["error"]), file=sys.stderr)
+        else:
+            print(
+                "{}: {:.3f}s".format(result["url"], result["timings"]["total"]),
+                file=sys.stderr,
+            )
+    if out is not sys.stdout:
+        out.close()
+    print(
+        "{} pages, {} failed, {:.3f}s".format(
+            len(urls), failed, time.perf_counter() - start
+        ),
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
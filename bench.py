@@ -0,0 +1,183 @@
+import gc
+import time
+import tracemalloc
+from typing import List
+
+from browser import HEIGHT, DocumentLayout, DrawRect, DrawText
+from dom_arena import DOMArena
+from font import WIDTHS, MonospaceBackend, set_backend
+from html_parser import HTMLParser, Node, Text
+from request import CHUNK_SIZE
+from snapshot import dumps, loads
+
+MB = 1024 * 1024
+
+
+def make_document(size: int) -> str:
+    section = (
+        '<div class="section"><h2>Heading</h2>'
+        "<p>Lorem ipsum <b>dolor</b> sit amet, <i>consectetur</i> adipiscing "
+        "elit, sed do eiusmod tempor incididunt ut labore et dolore magna "
+        "aliqua.<br>Ut enim ad minim veniam, quis nostrud exercitation.</p>"
+        "<ul><li>one</li><li>two</li><li>three</li></ul>"
+        "<pre>code   block</pre></div>\n"
+    )
+    return "<!doctype html><html><body>" + section * (size // len(section) + 1)
+
+
+def make_text_document(size: int) -> str:
+    paragraph = "<p>" + "Lorem ipsum dolor sit amet, consectetur. " * 50 + "</p>\n"
+    return "<!doctype html><html><body>" + paragraph * (size // len(paragraph) + 1)
+
+
+def make_nested_document(size: int) -> str:
+    depth = 500
+    block = "<div>" * depth + "text" + "</div>" * depth + "\n"
+    return "<!doctype html><html><body>" + block * (size // len(block) + 1)
+
+
+def bench_parse(size: int = 4 * MB) -> None:
+    for name, body in [
+        ("markup", make_document(size)),
+        ("text", make_text_document(size)),
+        ("nested", make_nested_document(size)),
+    ]:
+        start = time.perf_counter()
+        HTMLParser(body).parse()
+        elapsed = time.perf_counter() - start
+        print(
+            "parse ({}): {:.1f} MB in {:.3f}s, {:.1f} MB/s".format(
+                name, len(body) / MB, elapsed, len(body) / MB / elapsed
+            )
+        )
+
+
+def bench_memory(size: int = 4 * MB) -> None:
+    body = make_document(size)
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    tree = HTMLParser(body).parse()
+    gc.collect()
+    tree_bytes = tracemalloc.get_traced_memory()[0] - base
+
+    arena = DOMArena.from_tree(tree)
+    del tree
+    gc.collect()
+    arena_bytes = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+
+    nodes = len(arena)
+    print(
+        "memory: {} nodes, tree {:.1f} B/node, arena {:.1f} B/node, "
+        "saved {:.1f} B/node".format(
+            nodes,
+            tree_bytes / nodes,
+            arena_bytes / nodes,
+            (tree_bytes - arena_bytes) / nodes,
+        )
+    )
+
+
+def count_words(node: Node) -> int:
+    if isinstance(node, Text):
+        return len(node.text.split())
+    return sum([count_words(child) for child in node.children])
+
+
+def bench_layout(size: int = 2 * MB) -> None:
+    # Metrics come from the monospace backend, so this measures line
+    # breaking rather than Tk.
+    set_backend(MonospaceBackend())
+    for name, body in [
+        ("markup", make_document(size)),
+        ("text", make_text_document(size)),
+    ]:
+        tree = HTMLParser(body).parse()
+        words = count_words(tree)
+        WIDTHS.reset_stats()
+        start = time.perf_counter()
+        DocumentLayout(tree).layout()
+        elapsed = time.perf_counter() - start
+        print(
+            "layout ({}): {} words in {:.3f}s, {:.0f} words/s, "
+            "width cache hit rate {:.1%}".format(
+                name, words, elapsed, words / elapsed, WIDTHS.hit_rate()
+            )
+        )
+
+
+def bench_progressive(size: int = 2 * MB) -> None:
+    # Feeds the body in network-sized chunks the way Browser.poll() does,
+    # laying out the partial tree each time its size doubles.
+    set_backend(MonospaceBackend())
+    body = make_document(size)
+    start = time.perf_counter()
+    parser = HTMLParser()
+    document = None
+    first_paint = None
+    shown = 0
+    for i in range(0, len(body), CHUNK_SIZE):
+        parser.feed(body[i : i + CHUNK_SIZE])
+        root = parser.root()
+        received = i + CHUNK_SIZE
+        if root is None or received < 2 * shown:
+            continue
+        shown = received
+        if document is None:
+            document = DocumentLayout(root)
+        document.layout()
+        display_list: List[DrawText | DrawRect] = []
+        document.paint(display_list)
+        if first_paint is None and document.height >= HEIGHT:
+            first_paint = time.perf_counter() - start
+    parser.close()
+    assert document is not None and first_paint is not None
+    document.layout()
+    progressive = time.perf_counter() - start
+
+    start = time.perf_counter()
+    DocumentLayout(HTMLParser(body).parse()).layout()
+    whole = time.perf_counter() - start
+    print(
+        "progressive: first paint {:.3f}s, full layout {:.3f}s "
+        "(all at once: {:.3f}s)".format(first_paint, progressive, whole)
+    )
+
+
+def bench_snapshot(size: int = 2 * MB) -> None:
+    set_backend(MonospaceBackend())
+    body = make_document(size)
+    start = time.perf_counter()
+    document = DocumentLayout(HTMLParser(body).parse())
+    document.layout()
+    display_list: List[DrawText | DrawRect] = []
+    document.paint(display_list)
+    computed = time.perf_counter() - start
+
+    data = dumps(document.height, display_list)
+    start = time.perf_counter()
+    loads(data)
+    loaded = time.perf_counter() - start
+    print(
+        "snapshot: {} commands, {:.1f} B/command, parse and layout {:.3f}s, "
+        "load {:.3f}s".format(
+            len(display_list), len(data) / len(display_list), computed, loaded
+        )
+    )
+
+
+BENCHMARKS = {
+    "parse": bench_parse,
+    "memory": bench_memory,
+    "layout": bench_layout,
+    "progressive": bench_progressive,
+    "snapshot": bench_snapshot,
+}
+
+
+if __name__ == "__main__":
+    import sys
+
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -1,62 +1,79 @@
 from __future__ import annotations
 
+import bisect
+import queue
+import threading
+import time
 import tkinter
 import tkinter.font
-from typing import List, Literal, Optional, Tuple
+from typing import Dict, List, Literal, Optional, Tuple
 
-from font import get_font
+from font import FontHandle, get_font
 from html_parser import Element, HTMLParser, Node, Text
-from request import request
+from http_cache import HTTPCache
+from request import ConnectionPool, stream
 
 WIDTH, HEIGHT = 800, 600
 HSTEP, VSTEP = 13, 18
 SCROLL_STEP = 100
-
-BLOCK_ELEMENTS = [
-    "html",
-    "body",
-    "article",
-    "section",
-    "nav",
-    "aside",
-    "h1",
-    "h2",
-    "h3",
-    "h4",
-    "h5",
-    "h6",
-    "hgroup",
-    "header",
-    "footer",
-    "address",
-    "p",
-    "hr",
-    "pre",
-    "blockquote",
-    "ol",
-    "ul",
-    "menu",
-    "li",
-    "dl",
-    "dt",
-    "dd",
-    "figure",
-    "figcaption",
-    "main",
-    "div",
-    "table",
-    "form",
-    "fieldset",
-    "legend",
-    "details",
-    "summary",
-]
+LINE_CACHE_SIZE = 4
+POLL_INTERVAL = 16
+# Seconds poll() may spend parsing before it lets Tk handle events again.
+POLL_BUDGET = 0.008
+
+BLOCK_ELEMENTS = frozenset(
+    [
+        "html",
+        "body",
+        "article",
+        "section",
+        "nav",
+        "aside",
+        "h1",
+        "h2",
+        "h3",
+        "h4",
+        "h5",
+        "h6",
+        "hgroup",
+        "header",
+        "footer",
+        "address",
+        "p",
+        "hr",
+        "pre",
+        "blockquote",
+        "ol",
+        "ul",
+        "menu",
+        "li",
+        "dl",
+        "dt",
+        "dd",
+        "figure",
+        "figcaption",
+        "main",
+        "div",
+        "table",
+        "form",
+        "fieldset",
+        "legend",
+        "details",
+        "summary",
+    ]
+)
 
 
 def layout_mode(node: Node) -> Literal["block", "inline"]:
     if isinstance(node, Text):
         return "inline"
-    elif node.children:
+    if node.mode is None:
+        node.mode = compute_layout_mode(node)
+    return node.mode
+
+
+def compute_layout_mode(node: Element) -> Literal["block", "inline"]:
+    if node.children:
         for child in node.children:
             if isinstance(child, Text):
                 continue
@@ -79,30 +96,32 @@ class BlockLayout:
         self.previous = previous
         self.children: List[BlockLayout | InlineLayout] = []
         self.x: Optional[int] = None
-        self.y: Optional[int] = None
+        self.y: Optional[float] = None
         self.width: Optional[int] = None
-        self.height: Optional[int] = None
+        self.height: Optional[float] = None
 
     def layout(self) -> None:
-        previous = None
-        for child_node in self.node.children:
-            next: BlockLayout | InlineLayout
-            if layout_mode(child_node) == "inline":
-                next = InlineLayout(child_node, self, previous)
-            else:
-                next = BlockLayout(child_node, self, previous)
-            self.children.append(next)
-            previous = next
-
-        self.width = self.parent.width
-        self.x = self.parent.x
-
         if self.previous:
             assert self.previous.y is not None
             assert self.previous.height is not None
-            self.y = self.previous.y + self.previous.height
+            y = self.previous.y + self.previous.height
         else:
-            self.y = self.parent.y
+            assert self.parent.y is not None
+            y = self.parent.y
+
+        # A clean subtree at the same width only needs to move.
+        if not self.node.dirty and self.width == self.parent.width:
+            assert self.y is not None
+            if y != self.y:
+                self.shift(y - self.y)
+            return
+
+        if self.node.dirty or not self.children:
+            self.build_children()
+
+        self.width = self.parent.width
+        self.x = self.parent.x
+        self.y = y
 
         for child in self.children:
             child.layout()
@@ -110,6 +129,32 @@ class BlockLayout:
         self.height = sum(
             [child.height if child.height else 0 for child in self.children]
         )
+        self.node.dirty = False
+
+    def build_children(self) -> None:
+        # Keep the layout objects of children that are still there, so
+        # their line breaking is not redone unless they changed.
+        old = {id(child.node): child for child in self.children}
+        self.children = []
+        previous = None
+        for child_node in self.node.children:
+            next: BlockLayout | InlineLayout
+            reuse = old.get(id(child_node))
+            if layout_mode(child_node) == "inline":
+                if not isinstance(reuse, InlineLayout):
+                    reuse = InlineLayout(child_node, self, previous)
+            elif not isinstance(reuse, BlockLayout):
+                reuse = BlockLayout(child_node, self, previous)
+            next = reuse
+            next.previous = previous
+            self.children.append(next)
+            previous = next
+
+    def shift(self, dy: float) -> None:
+        assert self.y is not None
+        self.y += dy
+        for child in self.children:
+            child.shift(dy)
 
     def paint(self, display_list: List[DrawText | DrawRect]) -> None:
         for child in self.children:
@@ -128,19 +173,19 @@ class InlineLayout:
         self.previous = previous
         self.children: List[BlockLayout | InlineLayout] = []
         self.x: Optional[int] = None
-        self.y: Optional[int] = None
+        self.y: Optional[float] = None
         self.width: Optional[int] = None
-        self.height: Optional[int] = None
-        self.display_list: Optional[
-            List[Tuple[int, float, str, tkinter.font.Font]]
-        ] = None
+        self.height: Optional[float] = None
+        # Word positions; y is relative to self.y so moving is free.
+        self.display_list: Optional[List[Tuple[int, float, str, FontHandle]]] = None
         self.cursor_x: Optional[int] = None
         self.cursor_y: Optional[float] = None
+        self.cache: Dict[
+            Tuple[Optional[int], Optional[int]],
+            Tuple[List[Tuple[int, float, str, FontHandle]], float],
+        ] = {}
 
     def layout(self) -> None:
-        self.width = self.parent.width
-        self.x = self.parent.x
-
         if self.previous:
             assert self.previous.y is not None
             assert self.previous.height is not None
@@ -148,22 +193,44 @@ class InlineLayout:
         else:
             self.y = self.parent.y
 
+        if not self.node.dirty and self.width == self.parent.width:
+            return
+
+        self.width = self.parent.width
+        self.x = self.parent.x
+
+        # Line breaks depend only on the content and the available width,
+        # so the results for recent widths are kept until the content changes.
+        if self.node.dirty:
+            self.cache.clear()
+        key = (self.x, self.width)
+        if key in self.cache:
+            self.display_list, self.height = self.cache.pop(key)
+            self.cache[key] = (self.display_list, self.height)
+            return
+
         self.display_list = []
         self.weight: Literal["normal", "bold"] = "normal"
         self.style: Literal["roman", "italic"] = "roman"
         self.size = 16
 
         self.cursor_x = self.x
-        self.cursor_y = self.y
-        self.line: List[Tuple[int, str, tkinter.font.Font]] = []
+        self.cursor_y = 0
+        self.line: List[Tuple[int, str, FontHandle]] = []
+        self.line_ascent = 0
+        self.line_descent = 0
         self.recurse(self.node)
         self.flush()
 
         assert self.cursor_y is not None
-        assert self.y is not None
-        self.height = self.cursor_y - self.y
+        self.height = self.cursor_y
+
+        self.cache[key] = (self.display_list, self.height)
+        if len(self.cache) > LINE_CACHE_SIZE:
+            del self.cache[next(iter(self.cache))]
 
     def recurse(self, tree: Node) -> None:
+        tree.dirty = False
         if isinstance(tree, Text):
             self.text(tree)
         else:
@@ -200,29 +267,60 @@ class InlineLayout:
 
     def text(self, node: Text) -> None:
         font = get_font(self.size, self.weight, self.style)
-        for word in node.text.split():
-            w = font.measure(word)
-            assert self.cursor_x is not None
-            if self.cursor_x + w > WIDTH - HSTEP:
-                self.flush()
-            self.line.append((self.cursor_x, word, font))
-            self.cursor_x += w + font.measure(" ")
-
-    def flush(self) -> None:
+        words = node.text.split()
+        if not words:
+            return
+        widths = font.measure_words(words)
+
+        assert self.cursor_x is not None
+        assert self.x is not None and self.width is not None
+        x = self.cursor_x
+        right = self.x + self.width
+        space = font.space
+        line = self.line
+        # The line metrics only change when a line gains its first word in
+        # this font: here, or in flush() when a line is broken below.
+        if line and x + widths[0] > right:
+            self.flush(font)
+            x = self.cursor_x
+            line = self.line
+        else:
+            if font.ascent > self.line_ascent:
+                self.line_ascent = font.ascent
+            if font.descent > self.line_descent:
+                self.line_descent = font.descent
+        for word, w in zip(words, widths):
+            if x + w > right and line:
+                self.flush(font)
+                x = self.cursor_x
+                line = self.line
+            line.append((x, word, font))
+            x += w + space
+        self.cursor_x = x
+
+    def flush(self, next_font: Optional[FontHandle] = None) -> None:
+        # Emits the current line and starts a new one, which begins with a
+        # word in `next_font` if the line was broken inside a text run.
         if not self.line:
             return
-        metrics = [font.metrics() for x, word, font in self.line]
-        max_ascent = max([metric["ascent"] for metric in metrics])
         assert self.cursor_y is not None
-        baseline = self.cursor_y + 1.25 * max_ascent
-        for x, word, font in self.line:
-            y = baseline - font.metrics("ascent")
-            assert self.display_list is not None
-            self.display_list.append((x, y, word, font))
+        assert self.display_list is not None
+        baseline = self.cursor_y + 1.25 * self.line_ascent
+        self.display_list.extend(
+            [(x, baseline - font.ascent, word, font) for x, word, font in self.line]
+        )
         self.cursor_x = HSTEP
+        self.cursor_y = baseline + 1.25 * self.line_descent
         self.line = []
-        max_descent = max([metric["descent"] for metric in metrics])
-        self.cursor_y = baseline + 1.25 * max_descent
+        if next_font:
+            self.line_ascent = next_font.ascent
+            self.line_descent = next_font.descent
+        else:
+            self.line_ascent = self.line_descent = 0
+
+    def shift(self, dy: float) -> None:
+        assert self.y is not None
+        self.y += dy
 
     def paint(self, display_list: List[DrawText | DrawRect]) -> None:
         if isinstance(self.node, Element) and self.node.tag == "pre":
@@ -234,22 +332,25 @@ class InlineLayout:
             rect = DrawRect(self.x, self.y, x2, y2, "gray")
             display_list.append(rect)
         assert self.display_list is not None
+        assert self.y is not None
         for x, y, word, font in self.display_list:
-            display_list.append(DrawText(x, y, word, font))
+            display_list.append(DrawText(x, self.y + y, word, font))
 
 
 class DocumentLayout:
-    def __init__(self, node: Node):
+    def __init__(self, node: Node, width: int = WIDTH):
         self.node = node
         self.parent = None
         self.previous = None
         self.children: List[BlockLayout | InlineLayout] = []
+        self.viewport_width = width
 
     def layout(self) -> None:
-        child = BlockLayout(self.node, self, None)
-        self.children.append(child)
+        if not self.children:
+            self.children.append(BlockLayout(self.node, self, None))
+        child = self.children[0]
 
-        self.width = WIDTH - 2 * HSTEP
+        self.width = self.viewport_width - 2 * HSTEP
         self.x = HSTEP
         self.y = VSTEP
         child.layout()
@@ -261,20 +362,21 @@ class DocumentLayout:
 
 
 class DrawText:
-    def __init__(self, x1: float, y1: float, text: str, font: tkinter.font.Font):
+    def __init__(self, x1: float, y1: float, text: str, font: FontHandle):
         self.top = y1
         self.left = x1
         self.text = text
         self.font = font
 
-        self.bottom = y1 + font.metrics("linespace")
+        self.bottom = y1 + font.linespace
 
-    def execute(self, scroll: float, canvas: tkinter.Canvas) -> None:
-        canvas.create_text(
+    def execute(self, scroll: float, canvas: tkinter.Canvas) -> int:
+        assert isinstance(self.font.font, tkinter.font.Font), "Canvas needs Tk fonts"
+        return canvas.create_text(
             self.left,
             self.top - scroll,
             text=self.text,
-            font=self.font,
+            font=self.font.font,
             anchor="nw",
         )
 
@@ -292,8 +394,8 @@ class DrawRect:
         self.right = x2
         self.color = color
 
-    def execute(self, scroll: float, canvas: tkinter.Canvas) -> None:
-        canvas.create_rectangle(
+    def execute(self, scroll: float, canvas: tkinter.Canvas) -> int:
+        return canvas.create_rectangle(
             self.left,
             self.top - scroll,
             self.right,
@@ -308,39 +410,262 @@ class DrawRect:
         )
 
 
+class DisplayListIndex:
+    # Finds the commands that overlap a vertical band in time proportional
+    # to the number found. Commands are sorted by top; since none of them
+    # is taller than `reach`, only tops in [top - reach, bottom] can
+    # overlap. The few taller ones (like <pre> backgrounds) are kept apart
+    # and checked one by one. Results come back in paint order.
+    def __init__(self, display_list: List[DrawText | DrawRect], tall: int = HEIGHT):
+        self.display_list = display_list
+        self.tall: List[int] = []
+        short: List[int] = []
+        for i, cmd in enumerate(display_list):
+            if cmd.bottom - cmd.top > tall:
+                self.tall.append(i)
+            else:
+                short.append(i)
+        short.sort(key=lambda i: display_list[i].top)
+        self.order = short
+        self.tops = [display_list[i].top for i in short]
+        self.reach = max(
+            [display_list[i].bottom - display_list[i].top for i in short], default=0
+        )
+
+    def query(self, top: float, bottom: float) -> List[DrawText | DrawRect]:
+        return [self.display_list[i] for i in self.visible(top, bottom)]
+
+    def visible(self, top: float, bottom: float) -> List[int]:
+        start = bisect.bisect_left(self.tops, top - self.reach)
+        end = bisect.bisect_right(self.tops, bottom)
+        display_list = self.display_list
+        hits = [i for i in self.order[start:end] if display_list[i].bottom >= top]
+        for i in self.tall:
+            if display_list[i].top <= bottom and display_list[i].bottom >= top:
+                hits.append(i)
+        hits.sort()
+        return hits
+
+
+class LoadToken:
+    # Handed to the worker thread for one load; a newer load cancels it so
+    # the worker stops early and its result is dropped.
+    def __init__(self, url: str):
+        self.url = url
+        self.cancelled = threading.Event()
+        self.start = time.perf_counter()
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+
+def fetch_and_parse(
+    url: str, pool: ConnectionPool, cache: Optional[HTTPCache], token: LoadToken
+) -> Optional[Node]:
+    if cache:
+        headers, chunks = cache.stream(url, pool, accept_encoding=True)
+    else:
+        headers, chunks = stream(url, pool, accept_encoding=True)
+    parser = HTMLParser()
+    for chunk in chunks:
+        if token.cancelled.is_set():
+            chunks.close()
+            return None
+        parser.feed(chunk)
+    return parser.close()
+
+
 class Browser:
-    def __init__(self) -> None:
+    # With `progressive` set, the part of the page parsed so far is laid
+    # out and drawn whenever more of the body arrives; otherwise nothing
+    # changes until the whole page is loaded. Pages come from `cache`
+    # when it has a fresh copy.
+    def __init__(
+        self, progressive: bool = True, cache: Optional[HTTPCache] = None
+    ) -> None:
         self.window = tkinter.Tk()
         self.canvas = tkinter.Canvas(self.window, width=WIDTH, height=HEIGHT)
-        self.canvas.pack()
+        self.canvas.pack(fill="both", expand=True)
+        self.width = WIDTH
+        self.height = HEIGHT
 
-        self.scroll = 0
+        self.scroll: float = 0
         self.window.bind("<Down>", self.scrolldown)
+        self.window.bind("<Configure>", self.resize)
         self.display_list: List[DrawText | DrawRect] = []
+        self.index = DisplayListIndex(self.display_list)
+        self.clear()
+        self.document: Optional[DocumentLayout] = None
+        self.pool = ConnectionPool()
+        self.cache = cache
+
+        self.progressive = progressive
+        self.loading: Optional[LoadToken] = None
+        self.parser = HTMLParser()
+        # Characters of the body parsed so far, and when it was last shown.
+        self.received = 0
+        self.shown = 0
+        # Seconds from load() to the first paint of the new page and to
+        # the layout of the whole page.
+        self.timings: Dict[str, float] = {}
+        # Chunks of the body when loading progressively, otherwise the
+        # finished DOM; None marks the end of the body.
+        self.results: queue.Queue[
+            Tuple[LoadToken, str | Node | None, Optional[Exception]]
+        ] = queue.Queue()
+        self.thread: Optional[threading.Thread] = None
 
     def load(self, url: str) -> None:
-        headers, body = request(url)
-        self.nodes = HTMLParser(body).parse()
-        self.document = DocumentLayout(self.nodes)
+        # Fetching runs on a worker thread. A page shown while it loads is
+        # read by layout, so it is parsed on this thread, in poll(), as
+        # chunks arrive; otherwise the worker parses it too.
+        polling = self.loading is not None
+        if self.loading:
+            self.loading.cancel()
+        self.loading = token = LoadToken(url)
+        self.parser = HTMLParser()
+        self.received = self.shown = 0
+        self.timings = {}
+        self.thread = threading.Thread(target=self.fetch, args=(token,), daemon=True)
+        self.thread.start()
+        if not polling:
+            self.window.after(POLL_INTERVAL, self.poll)
+
+    def fetch(self, token: LoadToken) -> None:
+        try:
+            if not self.progressive:
+                nodes = fetch_and_parse(token.url, self.pool, self.cache, token)
+                if nodes is not None:
+                    self.results.put((token, nodes, None))
+                return
+            if self.cache:
+                headers, chunks = self.cache.stream(
+                    token.url, self.pool, accept_encoding=True
+                )
+            else:
+                headers, chunks = stream(token.url, self.pool, accept_encoding=True)
+            for chunk in chunks:
+                if token.cancelled.is_set():
+                    chunks.close()
+                    return
+                self.results.put((token, chunk, None))
+        except Exception as e:
+            self.results.put((token, None, e))
+        else:
+            if self.progressive:
+                self.results.put((token, None, None))
+
+    def poll(self) -> None:
+        # Parsing is spread over several calls when chunks arrive faster
+        # than they are parsed, so the window stays responsive.
+        deadline = time.perf_counter() + POLL_BUDGET
+        while not self.results.empty():
+            token, result, error = self.results.get()
+            if token is not self.loading:
+                continue
+            if error:
+                self.loading = None
+                print("Failed to load {}: {}".format(token.url, error))
+            elif isinstance(result, str):
+                self.parser.feed(result)
+                self.received += len(result)
+                if time.perf_counter() >= deadline:
+                    break
+            else:
+                self.loading = None
+                self.show(self.parser.close() if result is None else result)
+                self.timings["layout"] = time.perf_counter() - token.start
+                self.timings.setdefault("first_paint", self.timings["layout"])
+        # Each partial layout repaints the whole page so far, so they are
+        # spaced out as the page doubles in size; that keeps the total work
+        # within a small factor of laying out the page once.
+        doubled = self.received >= max(2 * self.shown, 1)
+        if self.progressive and self.loading and doubled:
+            self.show_partial(self.loading)
+        if self.loading:
+            self.window.after(POLL_INTERVAL, self.poll)
+
+    def show_partial(self, token: LoadToken) -> None:
+        # Only the subtrees the parser added to since the last call are
+        # laid out again.
+        nodes = self.parser.root()
+        if nodes is None:
+            return
+        self.show(nodes)
+        self.shown = self.received
+        if self.display_list and "first_paint" not in self.timings:
+            self.timings["first_paint"] = time.perf_counter() - token.start
+
+    def show(self, nodes: Node) -> None:
+        if self.document is None or self.document.node is not nodes:
+            self.document = DocumentLayout(nodes, self.width)
+            self.scroll = 0
+        self.relayout()
+
+    def relayout(self) -> None:
+        # After a DOM change only the subtrees marked dirty are laid out again.
+        assert self.document is not None
         self.document.layout()
         self.display_list = []
         self.document.paint(self.display_list)
+        self.index = DisplayListIndex(self.display_list)
+        self.clear()
         self.draw()
 
-    def draw(self) -> None:
+    def clear(self) -> None:
         self.canvas.delete("all")
-        for cmd in self.display_list:
-            if cmd.top > self.scroll + HEIGHT:
-                continue
-            if cmd.bottom < self.scroll:
+        # Canvas item ids by display list index, and the sorted indices.
+        self.items: Dict[int, int] = {}
+        self.drawn: List[int] = []
+        self.drawn_scroll: float = 0
+
+    def draw(self) -> None:
+        # Items stay on the canvas while they are visible. Scrolling moves
+        # all of them with one call, and only commands that enter or leave
+        # the viewport cost a create or delete.
+        if self.scroll != self.drawn_scroll:
+            self.canvas.move("all", 0, self.drawn_scroll - self.scroll)
+            self.drawn_scroll = self.scroll
+
+        visible = self.index.visible(self.scroll, self.scroll + self.height)
+        visible_set = set(visible)
+        for i in self.drawn:
+            if i not in visible_set:
+                self.canvas.delete(self.items.pop(i))
+        self.drawn = [i for i in self.drawn if i in visible_set]
+
+        for i in visible:
+            if i in self.items:
                 continue
-            cmd.execute(self.scroll, self.canvas)
+            item = self.display_list[i].execute(self.scroll, self.canvas)
+            self.items[i] = item
+            # Keep the stacking order of the display list when a command
+            # appears after ones painted later than it.
+            position = bisect.bisect(self.drawn, i)
+            if position < len(self.drawn):
+                self.canvas.tag_lower(item, self.items[self.drawn[position]])
+            self.drawn.insert(position, i)
 
     def scrolldown(self, e) -> None:  # type: ignore
-        max_y = self.document.height - HEIGHT
+        if not self.document:
+            return
+        max_y = self.document.height - self.height
         self.scroll = min(self.scroll + SCROLL_STEP, max_y)
         self.draw()
 
+    def resize(self, e) -> None:  # type: ignore
+        if e.widget is not self.window:
+            return
+        width, height = e.width, e.height
+        if (width, height) == (self.width, self.height):
+            return
+        self.width, self.height = width, height
+        if self.document and self.document.viewport_width != width:
+            self.document.viewport_width = width
+            self.relayout()
+        else:
+            self.draw()
+
 
 if __name__ == "__main__":
     import sys
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+from array import array
+from typing import Dict, List, Mapping, Optional
+
+from html_parser import EMPTY_ATTRIBUTES, Node, Text
+
+NONE = -1
+
+
+class DOMArena:
+    # A DOM tree flattened into parallel arrays indexed by node number, in
+    # document order. Tags and text share one list of strings; `is_text`
+    # tells them apart and only elements with attributes get an entry in
+    # `attributes`.
+    def __init__(self) -> None:
+        self.parent = array("i")
+        self.first_child = array("i")
+        self.next_sibling = array("i")
+        self.is_text = array("b")
+        self.data: List[str] = []
+        self.attributes: Dict[int, Mapping[str, str]] = {}
+
+    @classmethod
+    def from_tree(cls, root: Node) -> DOMArena:
+        arena = cls()
+        last_child: Dict[int, int] = {}
+        stack = [(root, NONE)]
+        while stack:
+            node, parent = stack.pop()
+            index = len(arena.data)
+            arena.parent.append(parent)
+            arena.first_child.append(NONE)
+            arena.next_sibling.append(NONE)
+            if isinstance(node, Text):
+                arena.is_text.append(1)
+                arena.data.append(node.text)
+            else:
+                arena.is_text.append(0)
+                arena.data.append(node.tag)
+                if node.attributes:
+                    arena.attributes[index] = node.attributes
+
+            if parent != NONE:
+                if parent in last_child:
+                    arena.next_sibling[last_child[parent]] = index
+                else:
+                    arena.first_child[parent] = index
+                last_child[parent] = index
+
+            for child in reversed(node.children):
+                stack.append((child, index))
+        return arena
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def root(self) -> ArenaNode:
+        return ArenaNode(self, 0)
+
+
+class ArenaNode:
+    # A lightweight view of one node in a DOMArena, with the same read-only
+    # interface as Text and Element.
+    __slots__ = ("arena", "index")
+
+    def __init__(self, arena: DOMArena, index: int):
+        self.arena = arena
+        self.index = index
+
+    @property
+    def is_text(self) -> bool:
+        return bool(self.arena.is_text[self.index])
+
+    @property
+    def tag(self) -> str:
+        assert not self.is_text
+        return self.arena.data[self.index]
+
+    @property
+    def text(self) -> str:
+        assert self.is_text
+        return self.arena.data[self.index]
+
+    @property
+    def attributes(self) -> Mapping[str, str]:
+        return self.arena.attributes.get(self.index, EMPTY_ATTRIBUTES)
+
+    @property
+    def parent(self) -> Optional[ArenaNode]:
+        parent = self.arena.parent[self.index]
+        return ArenaNode(self.arena, parent) if parent != NONE else None
+
+    @property
+    def children(self) -> List[ArenaNode]:
+        children = []
+        child = self.arena.first_child[self.index]
+        while child != NONE:
+            children.append(ArenaNode(self.arena, child))
+            child = self.arena.next_sibling[child]
+        return children
+
+    def __eq__(self, other: object) -> bool:
+        return (
+            isinstance(other, ArenaNode)
+            and self.arena is other.arena
+            and self.index == other.index
+        )
+
+    def __hash__(self) -> int:
+        return hash((id(self.arena), self.index))
+
+    def __repr__(self) -> str:
+        if self.is_text:
+            return repr(self.text)
+        attrs = [" " + k + '="' + v + '"' for k, v in self.attributes.items()]
+        return "<" + self.tag + "".join(attrs) + ">"
@@ -1,14 +1,269 @@
+import hashlib
+import json
 import tkinter.font
-from typing import Literal
+from collections import OrderedDict
+from typing import Any, Dict, List, Literal, Protocol, Sequence, Tuple
 
-FONTS = {}
+Weight = Literal["normal", "bold"]
+Slant = Literal["roman", "italic"]
+FontKey = Tuple[int, Weight, Slant]
 
 
-def get_font(
-    size: int, weight: Literal["normal", "bold"], slant: Literal["roman", "italic"]
-) -> tkinter.font.Font:
-    key = (size, weight, slant)
+class MeasuredFont(Protocol):
+    # The part of tkinter.font.Font that layout relies on.
+    def measure(self, text: str) -> int:
+        ...
+
+    def metrics(self) -> Any:
+        ...
+
+
+class FontBackend(Protocol):
+    # `version` changes whenever the backend could measure differently, so
+    # saved layouts can tell whether they are still valid.
+    name: str
+    version: str
+
+    def create(self, size: int, weight: Weight, slant: Slant) -> MeasuredFont:
+        ...
+
+
+class TkBackend:
+    # Tk measures with the fonts installed on this machine, which the
+    # version cannot capture; layouts saved with it are only valid here.
+    name = "tk"
+    version = "tk{}".format(tkinter.TkVersion)
+
+    def create(self, size: int, weight: Weight, slant: Slant) -> MeasuredFont:
+        return tkinter.font.Font(size=size, weight=weight, slant=slant)
+
+
+class MonospaceFont:
+    def __init__(self, size: int):
+        self.advance = round(size * 0.6)
+        self.ascent = round(size * 0.9)
+        self.descent = round(size * 0.25)
+
+    def measure(self, text: str) -> int:
+        return self.advance * len(text)
+
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "ascent": self.ascent,
+            "descent": self.descent,
+            "linespace": self.ascent + self.descent,
+            "fixed": 1,
+        }
+
+
+class MonospaceBackend:
+    # Synthetic metrics proportional to the font size; needs no display and
+    # gives the same layout on every machine.
+    name = "monospace"
+    version = "1"
+
+    def create(self, size: int, weight: Weight, slant: Slant) -> MeasuredFont:
+        return MonospaceFont(size)
+
+
+FIRST_GLYPH, LAST_GLYPH = 32, 127
+
+
+class GlyphTableFont:
+    # Widths are the sum of per-character advances, so kerning and
+    # ligatures that Tk would apply to a whole word are ignored.
+    def __init__(self, table: Dict[str, Any], scale: float = 1.0):
+        self.advances = {
+            chr(FIRST_GLYPH + i): round(advance * scale)
+            for i, advance in enumerate(table["advances"])
+        }
+        self.default = round(table["default"] * scale)
+        self.ascent = round(table["ascent"] * scale)
+        self.descent = round(table["descent"] * scale)
+        self.linespace = round(table["linespace"] * scale)
+
+    def measure(self, text: str) -> int:
+        get = self.advances.get
+        default = self.default
+        return sum([get(c, default) for c in text])
+
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "ascent": self.ascent,
+            "descent": self.descent,
+            "linespace": self.linespace,
+            "fixed": 0,
+        }
+
+
+class GlyphTableBackend:
+    # Advance tables measured once from Tk by generate_glyph_tables(), for
+    # laying out pages on machines without a display. Sizes missing from
+    # the tables are scaled from the nearest measured size.
+    name = "glyphs"
+
+    def __init__(self, tables: List[Dict[str, Any]]):
+        self.tables = tables
+        data = json.dumps(tables, sort_keys=True).encode("utf8")
+        self.version = hashlib.sha256(data).hexdigest()[:16]
+
+    @classmethod
+    def load(cls, path: str) -> "GlyphTableBackend":
+        with open(path) as f:
+            return cls(json.load(f)["fonts"])
+
+    def create(self, size: int, weight: Weight, slant: Slant) -> MeasuredFont:
+        candidates = [
+            table
+            for table in self.tables
+            if table["weight"] == weight and table["slant"] == slant
+        ]
+        assert candidates, "No glyph table for {} {}".format(weight, slant)
+        table = min(candidates, key=lambda table: abs(table["size"] - size))
+        return GlyphTableFont(table, size / table["size"])
+
+
+def generate_glyph_tables(
+    path: str, sizes: Sequence[int] = (10, 12, 14, 16, 18, 20, 24)
+) -> None:
+    tables = []
+    for size in sizes:
+        weights: List[Weight] = ["normal", "bold"]
+        slants: List[Slant] = ["roman", "italic"]
+        for weight in weights:
+            for slant in slants:
+                font = tkinter.font.Font(size=size, weight=weight, slant=slant)
+                metrics = font.metrics()
+                tables.append(
+                    {
+                        "size": size,
+                        "weight": weight,
+                        "slant": slant,
+                        "ascent": metrics["ascent"],
+                        "descent": metrics["descent"],
+                        "linespace": metrics["linespace"],
+                        "advances": [
+                            font.measure(chr(c)) for c in range(FIRST_GLYPH, LAST_GLYPH)
+                        ],
+                        "default": font.measure("M"),
+                    }
+                )
+    with open(path, "w") as f:
+        json.dump({"version": 1, "fonts": tables}, f)
+
+
+class FontHandle:
+    # A backend font together with its metrics, which never change for a
+    # given (size, weight, slant), so layout and paint never ask for them.
+    __slots__ = ("key", "font", "ascent", "descent", "linespace", "space")
+
+    def __init__(self, key: FontKey, font: MeasuredFont):
+        self.key = key
+        self.font = font
+        metrics = font.metrics()
+        self.ascent: int = metrics["ascent"]
+        self.descent: int = metrics["descent"]
+        self.linespace: int = metrics["linespace"]
+        self.space: int = font.measure(" ")
+
+    def measure(self, word: str) -> int:
+        return WIDTHS.measure(self, word)
+
+    def measure_words(self, words: List[str]) -> List[int]:
+        return WIDTHS.measure_words(self, words)
+
+    def __repr__(self) -> str:
+        return "FontHandle(size={} weight={} slant={})".format(*self.key)
+
+
+BACKEND: FontBackend = TkBackend()
+FONTS: Dict[FontKey, FontHandle] = {}
+
+
+def set_backend(backend: FontBackend) -> None:
+    global BACKEND
+    BACKEND = backend
+    FONTS.clear()
+    WIDTHS.clear()
+
+
+def backend_version() -> str:
+    return "{}:{}".format(BACKEND.name, BACKEND.version)
+
+
+def get_font(size: int, weight: Weight, slant: Slant) -> FontHandle:
+    key: FontKey = (size, weight, slant)
     if key not in FONTS:
-        font = tkinter.font.Font(size=size, weight=weight, slant=slant)
-        FONTS[key] = font
+        FONTS[key] = FontHandle(key, BACKEND.create(size, weight, slant))
     return FONTS[key]
+
+
+class WidthCache:
+    # Every Font.measure call is a round trip into Tk, and documents repeat
+    # the same words a lot, so widths are kept in a bounded LRU cache.
+    def __init__(self, maxsize: int = 16384):
+        self.maxsize = maxsize
+        self.widths: OrderedDict[Tuple[FontKey, str], int] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def measure(self, font: FontHandle, word: str) -> int:
+        entry = (font.key, word)
+        width = self.widths.get(entry)
+        if width is not None:
+            self.hits += 1
+            self.widths.move_to_end(entry)
+            return width
+        self.misses += 1
+        width = font.font.measure(word)
+        self.widths[entry] = width
+        if len(self.widths) > self.maxsize:
+            self.widths.popitem(last=False)
+        return width
+
+    def measure_words(self, font: FontHandle, words: List[str]) -> List[int]:
+        # The same lookups as measure(), for a whole run of text at once.
+        key = font.key
+        widths = self.widths
+        get = widths.get
+        move_to_end = widths.move_to_end
+        result = []
+        hits = 0
+        for word in words:
+            entry = (key, word)
+            width = get(entry)
+            if width is None:
+                width = self.measure(font, word)
+            else:
+                hits += 1
+                move_to_end(entry)
+            result.append(width)
+        self.hits += hits
+        return result
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def reset_stats(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self) -> None:
+        self.widths.clear()
+        self.reset_stats()
+
+    def __repr__(self) -> str:
+        return "WidthCache(size={} hits={} misses={} hit_rate={:.1%})".format(
+            len(self.widths), self.hits, self.misses, self.hit_rate()
+        )
+
+
+WIDTHS = WidthCache()
+
+
+if __name__ == "__main__":
+    import sys
+
+    tkinter.Tk()
+    generate_glyph_tables(sys.argv[1])
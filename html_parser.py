@@ -1,24 +1,42 @@
 from __future__ import annotations
 
-from typing import Dict, List, Tuple
+import re
+import sys
+from types import MappingProxyType
+from typing import Dict, List, Literal, Mapping, Optional, Tuple
+
+
+# Shared by every element without attributes; read-only so it stays empty.
+EMPTY_ATTRIBUTES: Mapping[str, str] = MappingProxyType({})
 
 
 class Text:
+    __slots__ = ("text", "parent", "dirty")
+
+    # Text nodes never have children; they all share one empty sequence.
+    children: Tuple[()] = ()
+
     def __init__(self, text: str, parent: Node):
         self.text = text
-        self.children: List[Node] = []
         self.parent = parent
+        self.dirty = True
 
     def __repr__(self) -> str:
         return repr(self.text)
 
 
 class Element:
-    def __init__(self, tag: str, attributes: Dict[str, str], parent: Node | None):
+    __slots__ = ("tag", "attributes", "children", "parent", "dirty", "mode")
+
+    def __init__(self, tag: str, attributes: Mapping[str, str], parent: Node | None):
         self.tag = tag
         self.attributes = attributes
         self.children: List[Node] = []
         self.parent = parent
+        self.dirty = True
+        # Block or inline layout, worked out from the children by the
+        # browser; reset whenever the children change.
+        self.mode: Optional[Literal["block", "inline"]] = None
 
     def __repr__(self) -> str:
         attrs = [" " + k + '="' + v + '"' for k, v in self.attributes.items()]
@@ -28,74 +46,123 @@ class Element:
 Node = Text | Element
 
 
+def mark_dirty(node: Node) -> None:
+    # Call after changing a node's text, attributes or children. Layout
+    # skips subtrees whose root is not dirty, so the flag is set on every
+    # ancestor too; layout clears it again.
+    if isinstance(node, Element):
+        node.mode = None
+    current: Node | None = node
+    while current is not None and not current.dirty:
+        current.dirty = True
+        current = current.parent
+
+
 def print_tree(node: Node, indent: int = 0) -> None:
     print(" " * indent, node)
     for child in node.children:
         print_tree(child, indent + 2)
 
 
+DELIMITER = re.compile("([<>])")
+
+
 class HTMLParser:
-    def __init__(self, body: str):
+    def __init__(self, body: str = ""):
         self.body = body
         self.unfinished: List[Element] = []
+        self.text = ""
+        self.in_tag = False
+        self.names: Dict[str, str] = {}
 
     def parse(self) -> Node:
-        text = ""
-        in_tag = False
-        for c in self.body:
-            if c == "<":
-                in_tag = True
+        self.feed(self.body)
+        return self.close()
+
+    def feed(self, chunk: str) -> None:
+        # Splitting on the delimiters gives alternating text and "<"/">"
+        # tokens, so the tokenizer never touches individual characters.
+        parts = DELIMITER.split(chunk)
+        text = self.text + parts[0]
+        for i in range(1, len(parts), 2):
+            if parts[i] == "<":
+                self.in_tag = True
                 if text:
                     self.add_text(text)
-                text = ""
-            elif c == ">":
-                in_tag = False
-                self.add_tag(text)
-                text = ""
             else:
-                text += c
-        if not in_tag and text:
-            self.add_text(text)
+                self.in_tag = False
+                self.add_tag(text)
+            text = parts[i + 1]
+        self.text = text
+
+    def close(self) -> Node:
+        if not self.in_tag and self.text:
+            self.add_text(self.text)
+        self.text = ""
         return self.finish()
 
-    def get_attributes(self, text: str) -> Tuple[str, Dict[str, str]]:
+    def root(self) -> Element | None:
+        # Open elements are attached to their parent as soon as they start,
+        # so this is a usable partial tree while the body is still arriving.
+        return self.unfinished[0] if self.unfinished else None
+
+    def get_attributes(self, text: str) -> Tuple[str, Mapping[str, str]]:
         parts = text.split()
-        tag = parts[0].lower()
+        tag = self.intern(parts[0])
+        if len(parts) == 1:
+            return tag, EMPTY_ATTRIBUTES
         attributes: Dict[str, str] = {}
         for attrpair in parts[1:]:
             if "=" in attrpair:
                 key, value = attrpair.split("=", 1)
                 if len(value) > 2 and value[0] in ["'", '"']:
                     value = value[1:-1]
-                attributes[key.lower()] = value
+                attributes[self.intern(key)] = value
             else:
-                attributes[attrpair.lower()] = ""
+                attributes[self.intern(attrpair)] = ""
         return tag, attributes
 
+    def intern(self, name: str) -> str:
+        # Lowercased names are shared between all nodes, so comparing tags
+        # is usually an identity check and each name is stored once.
+        interned = self.names.get(name)
+        if interned is None:
+            interned = self.names[name] = sys.intern(name.lower())
+        return interned
+
     def add_text(self, text: str) -> None:
         if text.isspace():
             return
         self.implicit_tags(None)
         parent = self.unfinished[-1]
-        node = Text(text, parent)
-        parent.children.append(node)
+        self.attach(parent, Text(text, parent))
 
-    SELF_CLOSING_TAGS = [
-        "area",
-        "base",
-        "br",
-        "col",
-        "embed",
-        "hr",
-        "img",
-        "input",
-        "link",
-        "meta",
-        "param",
-        "source",
-        "track",
-        "wbr",
-    ]
+    def attach(self, parent: Element, node: Node) -> None:
+        # The partial tree may already have been laid out, so a parent that
+        # gains a child has to be laid out again.
+        parent.children.append(node)
+        parent.mode = None
+        if not parent.dirty:
+            mark_dirty(parent)
+
+    SELF_CLOSING_TAGS = frozenset(
+        [
+            "area",
+            "base",
+            "br",
+            "col",
+            "embed",
+            "hr",
+            "img",
+            "input",
+            "link",
+            "meta",
+            "param",
+            "source",
+            "track",
+            "wbr",
+        ]
+    )
 
     def add_tag(self, tag: str) -> None:
         tag, attributes = self.get_attributes(tag)
@@ -106,43 +173,55 @@ class HTMLParser:
         if tag.startswith("/"):
             if len(self.unfinished) == 1:
                 return
-            node = self.unfinished.pop()
-            parent = self.unfinished[-1]
-            parent.children.append(node)
+            self.unfinished.pop()
         elif tag in self.SELF_CLOSING_TAGS:
             parent = self.unfinished[-1]
-            node = Element(tag, attributes, parent)
-            parent.children.append(node)
+            self.attach(parent, Element(tag, attributes, parent))
         else:
             parent = self.unfinished[-1] if self.unfinished else None  # type: ignore
             node = Element(tag, attributes, parent)
+            if parent is not None:
+                self.attach(parent, node)
             self.unfinished.append(node)
 
-    HEAD_TAGS = [
-        "base",
-        "basefont",
-        "bgsound",
-        "noscript",
-        "link",
-        "meta",
-        "title",
-        "style",
-        "script",
-    ]
+    HEAD_TAGS = frozenset(
+        [
+            "base",
+            "basefont",
+            "bgsound",
+            "noscript",
+            "link",
+            "meta",
+            "title",
+            "style",
+            "script",
+        ]
+    )
 
     def implicit_tags(self, tag: str | None) -> None:
+        # Implicit tags only matter while the open elements are [], [html]
+        # or [html, head], so the stack depth and its first two entries are
+        # enough to tell which state we are in.
         while True:
-            open_tags = [node.tag for node in self.unfinished]
-            if open_tags == [] and tag != "html":
+            depth = len(self.unfinished)
+            if depth == 0:
+                if tag == "html":
+                    break
                 self.add_tag("html")
-            elif open_tags == ["html"] and tag not in ["head", "body", "/html"]:
+            elif depth == 1 and self.unfinished[0].tag == "html":
+                if tag in ["head", "body", "/html"]:
+                    break
                 if tag in self.HEAD_TAGS:
                     self.add_tag("head")
                 else:
                     self.add_tag("body")
             elif (
-                open_tags == ["html", "head"] and tag not in ["/head"] + self.HEAD_TAGS
+                depth == 2
+                and self.unfinished[1].tag == "head"
+                and self.unfinished[0].tag == "html"
             ):
+                if tag == "/head" or tag in self.HEAD_TAGS:
+                    break
                 self.add_tag("/head")
             else:
                 break
@@ -151,7 +230,5 @@ class HTMLParser:
         if len(self.unfinished) == 0:
             self.add_tag("html")
         while len(self.unfinished) > 1:
-            node = self.unfinished.pop()
-            parent = self.unfinished[-1]
-            parent.children.append(node)
+            self.unfinished.pop()
         return self.unfinished.pop()
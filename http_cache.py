@@ -0,0 +1,336 @@
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Generator, Iterator, List, Optional, Tuple
+
+from request import (
+    CHUNK_SIZE,
+    Body,
+    ConnectionPool,
+    Headers,
+    Resolver,
+    decode_body,
+    decode_stream,
+    stream_response,
+)
+
+MB = 1024 * 1024
+CACHE_VERSION = 2
+
+# Describe the body as it was sent, not the decoded one the cache keeps.
+BODY_HEADERS = frozenset(["content-length", "content-encoding", "transfer-encoding"])
+
+
+def parse_cache_control(headers: Headers) -> Dict[str, Optional[str]]:
+    directives: Dict[str, Optional[str]] = {}
+    for directive in headers.get("cache-control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"') if value else None
+    return directives
+
+
+class CachedResponse:
+    # What the cache knows about one URL; the body is stored separately.
+    __slots__ = ("url", "headers", "stored", "size")
+
+    def __init__(self, url: str, headers: Headers, stored: float, size: int):
+        self.url = url
+        self.headers = headers
+        self.stored = stored
+        self.size = size
+
+    def max_age(self) -> int:
+        directives = parse_cache_control(self.headers)
+        if "no-cache" in directives:
+            return 0
+        try:
+            return int(directives.get("max-age") or 0)
+        except ValueError:
+            return 0
+
+    def is_fresh(self, now: float) -> bool:
+        return now - self.stored < self.max_age()
+
+    def validators(self) -> Headers:
+        headers: Headers = {}
+        if "etag" in self.headers:
+            headers["If-None-Match"] = self.headers["etag"]
+        if "last-modified" in self.headers:
+            headers["If-Modified-Since"] = self.headers["last-modified"]
+        return headers
+
+
+def is_cacheable(headers: Headers) -> bool:
+    directives = parse_cache_control(headers)
+    if "no-store" in directives:
+        return False
+    return "max-age" in directives or "etag" in headers or "last-modified" in headers
+
+
+class HTTPCache:
+    # Responses are kept in memory and on disk. On disk each URL has a
+    # metadata file and a body file that is memory-mapped when read, so
+    # several processes (like batch workers) can share one directory.
+    # Both tiers are bounded in bytes and evict the least recently used
+    # responses first; a disk hit touches the metadata file to record use.
+    def __init__(
+        self,
+        directory: str,
+        max_size: int = 256 * MB,
+        memory_size: int = 16 * MB,
+    ):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.max_size = max_size
+        self.memory_size = memory_size
+        self.memory: OrderedDict[str, Tuple[CachedResponse, bytes]] = OrderedDict()
+        self.memory_used = 0
+        self.disk_used = sum([entry.size for entry, base, used in self.disk_entries()])
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    def request(
+        self,
+        url: str,
+        pool: Optional[ConnectionPool] = None,
+        accept_encoding: bool = False,
+        connect_timeout: Optional[float] = None,
+        resolver: Optional[Resolver] = None,
+    ) -> Tuple[Headers, Body]:
+        headers, chunks = self.stream_bytes(
+            url,
+            pool,
+            accept_encoding,
+            connect_timeout=connect_timeout,
+            resolver=resolver,
+        )
+        return headers, decode_body(headers, b"".join(chunks))
+
+    def stream(
+        self,
+        url: str,
+        pool: Optional[ConnectionPool] = None,
+        accept_encoding: bool = False,
+        chunk_size: int = CHUNK_SIZE,
+        connect_timeout: Optional[float] = None,
+        resolver: Optional[Resolver] = None,
+    ) -> Tuple[Headers, Generator[str, None, None]]:
+        headers, chunks = self.stream_bytes(
+            url, pool, accept_encoding, chunk_size, connect_timeout, resolver
+        )
+        return headers, decode_stream(headers, chunks)
+
+    def stream_bytes(
+        self,
+        url: str,
+        pool: Optional[ConnectionPool] = None,
+        accept_encoding: bool = False,
+        chunk_size: int = CHUNK_SIZE,
+        connect_timeout: Optional[float] = None,
+        resolver: Optional[Resolver] = None,
+    ) -> Tuple[Headers, Generator[bytes, None, None]]:
+        cached = self.lookup(url)
+        if cached:
+            entry, body = cached
+            if entry.is_fresh(time.time()):
+                self.hits += 1
+                return entry.headers, split_body(body, chunk_size)
+            validators = entry.validators()
+        else:
+            validators = {}
+
+        status, headers, chunks = stream_response(
+            url,
+            pool,
+            accept_encoding,
+            chunk_size,
+            validators,
+            ("200", "304"),
+            connect_timeout,
+            resolver,
+        )
+        if status == "304" and cached:
+            for _ in chunks:
+                pass
+            self.revalidated += 1
+            entry, body = cached
+            updates = {k: v for k, v in headers.items() if k not in BODY_HEADERS}
+            headers = {**entry.headers, **updates}
+            self.store(url, headers, body)
+            return headers, split_body(body, chunk_size)
+
+        if cached and isinstance(cached[1], mmap.mmap):
+            cached[1].close()
+        self.misses += 1
+        if not is_cacheable(headers):
+            self.remove(url)
+            return headers, chunks
+        return headers, self.store_after(url, headers, chunks)
+
+    def store_after(
+        self, url: str, headers: Headers, chunks: Generator[bytes, None, None]
+    ) -> Generator[bytes, None, None]:
+        # Bodies that are abandoned halfway are not stored.
+        body: List[bytes] = []
+        try:
+            for chunk in chunks:
+                body.append(chunk)
+                yield chunk
+        finally:
+            chunks.close()
+        self.store(url, headers, b"".join(body))
+
+    def lookup(self, url: str) -> Optional[Tuple[CachedResponse, bytes | mmap.mmap]]:
+        with self.lock:
+            if url in self.memory:
+                self.memory.move_to_end(url)
+                return self.memory[url]
+
+        base = self.path(url)
+        try:
+            with open(base + ".json") as f:
+                metadata = json.load(f)
+            if metadata["version"] != CACHE_VERSION or metadata["url"] != url:
+                return None
+            entry = CachedResponse(
+                url, metadata["headers"], metadata["stored"], metadata["size"]
+            )
+            with open(base + ".body", "rb") as f:
+                if os.fstat(f.fileno()).st_size != entry.size:
+                    return None
+                body: bytes | mmap.mmap = b""
+                if entry.size:
+                    body = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            os.utime(base + ".json")
+        except (OSError, ValueError, KeyError):
+            return None
+
+        # Bodies too big to share the memory tier are read from the mapping.
+        if entry.size <= self.memory_size // 4:
+            body = bytes(body)
+            self.remember(entry, body)
+        return entry, body
+
+    def store(self, url: str, headers: Headers, body: bytes | mmap.mmap) -> None:
+        headers = {k: v for k, v in headers.items() if k not in BODY_HEADERS}
+        headers["content-length"] = str(len(body))
+        entry = CachedResponse(url, headers, time.time(), len(body))
+        base = self.path(url)
+        previous = self.disk_size(base)
+        if not isinstance(body, mmap.mmap):
+            # A revalidated body read from disk is already there.
+            write_file(base + ".body", body)
+        metadata = {
+            "version": CACHE_VERSION,
+            "url": url,
+            "headers": headers,
+            "stored": entry.stored,
+            "size": entry.size,
+        }
+        write_file(base + ".json", json.dumps(metadata).encode("utf8"))
+        with self.lock:
+            self.disk_used += entry.size - previous
+        if entry.size <= self.memory_size // 4:
+            self.remember(entry, bytes(body))
+        if self.disk_used > self.max_size:
+            self.evict()
+
+    def remember(self, entry: CachedResponse, body: bytes) -> None:
+        with self.lock:
+            old = self.memory.pop(entry.url, None)
+            if old:
+                self.memory_used -= old[0].size
+            self.memory[entry.url] = (entry, body)
+            self.memory_used += entry.size
+            while self.memory_used > self.memory_size:
+                url, (evicted, _) = self.memory.popitem(last=False)
+                self.memory_used -= evicted.size
+
+    def remove(self, url: str) -> None:
+        with self.lock:
+            old = self.memory.pop(url, None)
+            if old:
+                self.memory_used -= old[0].size
+        base = self.path(url)
+        size = self.disk_size(base)
+        for suffix in [".json", ".body"]:
+            try:
+                os.remove(base + suffix)
+            except FileNotFoundError:
+                pass
+        with self.lock:
+            self.disk_used -= size
+
+    def evict(self) -> None:
+        # Other processes may share the directory, so the sizes on disk are
+        # counted again rather than trusting disk_used.
+        entries = sorted(self.disk_entries(), key=lambda item: item[2])
+        with self.lock:
+            self.disk_used = sum([entry.size for entry, base, used in entries])
+        for entry, base, used in entries:
+            if self.disk_used <= self.max_size:
+                break
+            self.remove(entry.url)
+
+    def disk_entries(self) -> Iterator[Tuple[CachedResponse, str, float]]:
+        # Each response on disk, its path without suffix and when it was
+        # last used.
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            base = os.path.join(self.directory, name[: -len(".json")])
+            try:
+                with open(base + ".json") as f:
+                    used = os.fstat(f.fileno()).st_mtime
+                    metadata = json.load(f)
+                entry = CachedResponse(
+                    metadata["url"],
+                    metadata["headers"],
+                    metadata["stored"],
+                    metadata["size"],
+                )
+            except (OSError, ValueError, KeyError):
+                continue
+            yield entry, base, used
+
+    def disk_size(self, base: str) -> int:
+        try:
+            return os.path.getsize(base + ".body")
+        except OSError:
+            return 0
+
+    def path(self, url: str) -> str:
+        name = hashlib.sha256(url.encode("utf8")).hexdigest()
+        return os.path.join(self.directory, name)
+
+    def __repr__(self) -> str:
+        return "HTTPCache(hits={} revalidated={} misses={} memory={} disk={})".format(
+            self.hits, self.revalidated, self.misses, self.memory_used, self.disk_used
+        )
+
+
+def split_body(
+    body: bytes | mmap.mmap, chunk_size: int = CHUNK_SIZE
+) -> Generator[bytes, None, None]:
+    # A mapping is only read once, so it is closed when the body is done.
+    try:
+        for i in range(0, len(body), chunk_size):
+            yield body[i : i + chunk_size]
+    finally:
+        if isinstance(body, mmap.mmap):
+            body.close()
+
+
+def write_file(path: str, data: bytes) -> None:
+    # Written under another name first, so readers never see half a file.
+    temporary = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+    with open(temporary, "wb") as f:
+        f.write(data)
+    os.replace(temporary, path)
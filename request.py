@@ -1,12 +1,41 @@
+import codecs
+import io
+import queue
+import re
 import socket
 import ssl
-from typing import Dict, Tuple
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Generator, Iterator, List, Optional, Tuple
 
 Headers = Dict[str, str]
 Body = str
+Origin = Tuple[str, str, int]
+Address = Tuple[socket.AddressFamily, Tuple[Any, ...]]
 
+CHUNK_SIZE = 64 * 1024
+DNS_TTL = 60.0
+CONNECT_TIMEOUT = 10.0
+# Delay before trying the next address while earlier attempts are still
+# pending, from RFC 8305 (Happy Eyeballs).
+CONNECT_STAGGER = 0.25
+ACCEPT_ENCODING = "gzip, deflate"
+DEFAULT_CHARSET = "utf-8"
+# How much of the body is searched for a <meta> charset, as in HTML's
+# encoding sniffing.
+SNIFF_SIZE = 1024
+META_CHARSET = re.compile(
+    rb"""<meta[^>]*?charset\s*=\s*["']?\s*([-\w.:]+)""", re.IGNORECASE
+)
+BOMS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
 
-def request(url: str) -> Tuple[Headers, Body]:
+
+def parse_url(url: str) -> Tuple[str, str, int, str]:
     scheme, url = url.split("://", 1)
     assert scheme in ["http", "https"], "Unknown scheme {}".format(scheme)
 
@@ -22,42 +51,707 @@ def request(url: str) -> Tuple[Headers, Body]:
         host, _port = host.split(":", 1)
         port = int(_port)
 
-    s = socket.socket(
-        family=socket.AF_INET,
-        type=socket.SOCK_STREAM,
-        proto=socket.IPPROTO_TCP,
+    return scheme, host, port, path
+
+
+class Resolver:
+    """Caches DNS answers for `ttl` seconds.
+
+    getaddrinfo does not report record TTLs, so every answer is kept for the
+    same time. `getaddrinfo` defaults to socket.getaddrinfo, looked up on
+    each call; tests pass a stub.
+    """
+
+    def __init__(
+        self,
+        ttl: float = DNS_TTL,
+        getaddrinfo: Optional[Callable[..., List[Any]]] = None,
+    ):
+        self.ttl = ttl
+        self.getaddrinfo = getaddrinfo
+        self.cache: Dict[Tuple[str, int], Tuple[float, List[Address]]] = {}
+        self.lock = threading.Lock()
+
+    def resolve(self, host: str, port: int) -> List[Address]:
+        now = time.monotonic()
+        with self.lock:
+            cached = self.cache.get((host, port))
+            if cached and cached[0] > now:
+                return cached[1]
+        getaddrinfo = self.getaddrinfo or socket.getaddrinfo
+        infos = getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addresses: List[Address] = []
+        for family, type, proto, canonname, address in infos:
+            if (family, address) not in addresses:
+                addresses.append((family, address))
+        assert addresses, "No addresses for {}".format(host)
+        with self.lock:
+            self.cache[(host, port)] = (now + self.ttl, addresses)
+        return addresses
+
+    def clear(self) -> None:
+        with self.lock:
+            self.cache.clear()
+
+
+RESOLVER = Resolver()
+
+
+def interleave(addresses: List[Address]) -> List[Address]:
+    # Alternates address families, starting with the resolver's first
+    # choice, so one broken family cannot delay the other (RFC 8305).
+    families: Dict[socket.AddressFamily, List[Address]] = {}
+    for address in addresses:
+        families.setdefault(address[0], []).append(address)
+    queues = list(families.values())
+    result = []
+    while queues:
+        for addresses in queues:
+            result.append(addresses.pop(0))
+        queues = [addresses for addresses in queues if addresses]
+    return result
+
+
+def create_connection(
+    host: str,
+    port: int,
+    timeout: Optional[float] = None,
+    stagger: float = CONNECT_STAGGER,
+    resolver: Optional[Resolver] = None,
+) -> socket.socket:
+    """Connect to whichever of the host's addresses answers first.
+
+    Attempts start `stagger` seconds apart, or as soon as the previous one
+    fails, and run concurrently. The first to connect wins; the rest are
+    closed. Gives up after `timeout` seconds overall, CONNECT_TIMEOUT if
+    it is None.
+    """
+    if timeout is None:
+        timeout = CONNECT_TIMEOUT
+    addresses = interleave((resolver or RESOLVER).resolve(host, port))
+    deadline = time.monotonic() + timeout
+    results: queue.Queue[Tuple[Optional[socket.socket], Optional[OSError]]]
+    results = queue.Queue()
+    lock = threading.Lock()
+    done = False
+    attempts: List[socket.socket] = []
+
+    def attempt(family: socket.AddressFamily, address: Tuple[Any, ...]) -> None:
+        s = socket.socket(
+            family=family, type=socket.SOCK_STREAM, proto=socket.IPPROTO_TCP
+        )
+        with lock:
+            if done:
+                s.close()
+                return
+            attempts.append(s)
+        try:
+            s.settimeout(max(deadline - time.monotonic(), 0.001))
+            s.connect(address)
+            s.settimeout(None)
+        except OSError as e:
+            s.close()
+            results.put((None, e))
+            return
+        with lock:
+            if done:
+                s.close()
+            else:
+                results.put((s, None))
+
+    errors: List[OSError] = []
+    pending = 0
+    winner: Optional[socket.socket] = None
+    while winner is None:
+        if addresses:
+            family, address = addresses.pop(0)
+            thread = threading.Thread(target=attempt, args=(family, address))
+            thread.daemon = True
+            thread.start()
+            pending += 1
+        remaining = deadline - time.monotonic()
+        if not pending or remaining <= 0:
+            break
+        # Wait for an attempt to finish, but only until the next one is due
+        # while there are addresses left to try.
+        wait = min(stagger, remaining) if addresses else remaining
+        try:
+            s, error = results.get(timeout=wait)
+        except queue.Empty:
+            continue
+        pending -= 1
+        if s is not None:
+            winner = s
+        else:
+            assert error is not None
+            errors.append(error)
+
+    with lock:
+        done = True
+    while not results.empty():
+        s, error = results.get()
+        if s is not None and winner is None:
+            winner = s
+    # Closing the losers also cuts short attempts that are still waiting.
+    for s in attempts:
+        if s is not winner:
+            s.close()
+    if winner is not None:
+        return winner
+    if pending or not errors:
+        raise TimeoutError("Timed out connecting to {}:{}".format(host, port))
+    raise errors[-1]
+
+
+class Connection:
+    def __init__(self, origin: Origin, s: socket.socket):
+        self.origin = origin
+        self.socket = s
+        self.file: io.BufferedIOBase = s.makefile("rb")
+        self.last_used = time.monotonic()
+        self.reused = False
+
+    def close(self) -> None:
+        self.file.close()
+        self.socket.close()
+
+
+class ConnectionPool:
+    """Keeps HTTP/1.1 connections open between requests.
+
+    Idle connections are keyed by (scheme, host, port) and dropped after
+    `idle_timeout` seconds. At most `max_per_host` connections to one origin
+    exist at a time; further callers wait until one is released. New
+    connections are made with create_connection() and `connect_timeout`.
+    """
+
+    def __init__(
+        self,
+        max_per_host: int = 6,
+        idle_timeout: float = 30.0,
+        connect_timeout: Optional[float] = None,
+        resolver: Optional[Resolver] = None,
+    ):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.resolver = resolver
+        self.idle: Dict[Origin, List[Connection]] = {}
+        self.open: Dict[Origin, int] = {}
+        self.sessions: Dict[Origin, ssl.SSLSession] = {}
+        self.context: Optional[ssl.SSLContext] = None
+        self.lock = threading.Condition()
+
+    def acquire(self, scheme: str, host: str, port: int) -> Connection:
+        origin = (scheme, host, port)
+        with self.lock:
+            self.expire()
+            while True:
+                idle = self.idle.get(origin)
+                if idle:
+                    conn = idle.pop()
+                    conn.reused = True
+                    return conn
+                if self.open.get(origin, 0) < self.max_per_host:
+                    self.open[origin] = self.open.get(origin, 0) + 1
+                    break
+                self.lock.wait()
+        try:
+            return Connection(origin, self.connect(origin))
+        except BaseException:
+            self.forget(origin)
+            raise
+
+    def connect(self, origin: Origin) -> socket.socket:
+        scheme, host, port = origin
+        s = create_connection(host, port, self.connect_timeout, resolver=self.resolver)
+
+        if scheme == "https":
+            if self.context is None:
+                self.context = ssl.create_default_context()
+            session = self.sessions.get(origin)
+            if session is not None:
+                s = self.context.wrap_socket(s, server_hostname=host, session=session)
+            else:
+                s = self.context.wrap_socket(s, server_hostname=host)
+        return s
+
+    def release(self, conn: Connection) -> None:
+        conn.last_used = time.monotonic()
+        # TLS 1.3 servers send the session ticket after the handshake, so
+        # the session is only worth keeping once a response has been read.
+        session = getattr(conn.socket, "session", None)
+        with self.lock:
+            if session is not None and session.has_ticket:
+                self.sessions[conn.origin] = session
+            self.idle.setdefault(conn.origin, []).append(conn)
+            self.lock.notify_all()
+
+    def discard(self, conn: Connection) -> None:
+        conn.close()
+        self.forget(conn.origin)
+
+    def forget(self, origin: Origin) -> None:
+        with self.lock:
+            self.open[origin] -= 1
+            self.lock.notify_all()
+
+    def expire(self) -> None:
+        deadline = time.monotonic() - self.idle_timeout
+        for origin, idle in self.idle.items():
+            for conn in [conn for conn in idle if conn.last_used < deadline]:
+                idle.remove(conn)
+                conn.close()
+                self.open[origin] -= 1
+
+    def close(self) -> None:
+        with self.lock:
+            for origin, idle in self.idle.items():
+                for conn in idle:
+                    conn.close()
+                self.open[origin] -= len(idle)
+            self.idle = {}
+            self.lock.notify_all()
+
+
+def request(
+    url: str,
+    pool: Optional[ConnectionPool] = None,
+    accept_encoding: bool = False,
+    connect_timeout: Optional[float] = None,
+    resolver: Optional[Resolver] = None,
+) -> Tuple[Headers, Body]:
+    headers, body = request_bytes(url, pool, accept_encoding, connect_timeout, resolver)
+    return headers, decode_body(headers, body)
+
+
+def request_bytes(
+    url: str,
+    pool: Optional[ConnectionPool] = None,
+    accept_encoding: bool = False,
+    connect_timeout: Optional[float] = None,
+    resolver: Optional[Resolver] = None,
+) -> Tuple[Headers, bytes]:
+    headers, chunks = stream_bytes(
+        url,
+        pool,
+        accept_encoding,
+        connect_timeout=connect_timeout,
+        resolver=resolver,
     )
-    s.connect((host, port))
+    return headers, b"".join(chunks)
+
+
+def stream(
+    url: str,
+    pool: Optional[ConnectionPool] = None,
+    accept_encoding: bool = False,
+    chunk_size: int = CHUNK_SIZE,
+    connect_timeout: Optional[float] = None,
+    resolver: Optional[Resolver] = None,
+) -> Tuple[Headers, Generator[str, None, None]]:
+    """Like stream_bytes, but yields the body as text in its own charset."""
+    headers, chunks = stream_bytes(
+        url, pool, accept_encoding, chunk_size, connect_timeout, resolver
+    )
+    return headers, decode_stream(headers, chunks)
+
+
+def stream_bytes(
+    url: str,
+    pool: Optional[ConnectionPool] = None,
+    accept_encoding: bool = False,
+    chunk_size: int = CHUNK_SIZE,
+    connect_timeout: Optional[float] = None,
+    resolver: Optional[Resolver] = None,
+) -> Tuple[Headers, Generator[bytes, None, None]]:
+    """Return the headers as soon as they arrive, then the body as a generator.
+
+    The body is read at most `chunk_size` bytes at a time and yielded
+    as soon as it is available. The connection is closed, or returned to
+    `pool`, once the generator is exhausted. Without a pool, the connection
+    is made with `connect_timeout` and `resolver`; a pool uses its own.
+    """
+    status, headers, chunks = stream_response(
+        url,
+        pool,
+        accept_encoding,
+        chunk_size,
+        connect_timeout=connect_timeout,
+        resolver=resolver,
+    )
+    return headers, chunks
+
+
+def stream_response(
+    url: str,
+    pool: Optional[ConnectionPool] = None,
+    accept_encoding: bool = False,
+    chunk_size: int = CHUNK_SIZE,
+    extra_headers: Optional[Headers] = None,
+    statuses: Tuple[str, ...] = ("200",),
+    connect_timeout: Optional[float] = None,
+    resolver: Optional[Resolver] = None,
+) -> Tuple[str, Headers, Generator[bytes, None, None]]:
+    """Like stream_bytes, but also sends `extra_headers` and returns the status.
+
+    Any status in `statuses` is accepted; a 304 response has an empty body.
+    """
+    scheme, host, port, path = parse_url(url)
+    if pool is not None:
+        return stream_keepalive(
+            pool,
+            scheme,
+            host,
+            port,
+            path,
+            accept_encoding,
+            chunk_size,
+            extra_headers,
+            statuses,
+        )
+
+    s = create_connection(host, port, connect_timeout, resolver=resolver)
 
     if scheme == "https":
         ctx = ssl.create_default_context()
         s = ctx.wrap_socket(s, server_hostname=host)
 
-    s.send(
-        "GET {} HTTP/1.0\r\n".format(path).encode("utf8")
-        + "Host: {}\r\n\r\n".format(host).encode("utf8")
+    s.send(request_head("HTTP/1.0", host, path, accept_encoding, extra_headers))
+    response = s.makefile("rb")
+
+    version, status, explanation = parse_statusline(response.readline())
+    assert status in statuses, "{}: {}".format(status, explanation)
+
+    headers = read_headers(response)
+    if status == "304":
+        s.close()
+        return status, headers, empty_body()
+    return status, headers, close_after(read_body(response, headers, chunk_size), s)
+
+
+def stream_keepalive(
+    pool: ConnectionPool,
+    scheme: str,
+    host: str,
+    port: int,
+    path: str,
+    accept_encoding: bool = False,
+    chunk_size: int = CHUNK_SIZE,
+    extra_headers: Optional[Headers] = None,
+    statuses: Tuple[str, ...] = ("200",),
+) -> Tuple[str, Headers, Generator[bytes, None, None]]:
+    while True:
+        conn = pool.acquire(scheme, host, port)
+        try:
+            conn.socket.send(
+                request_head("HTTP/1.1", host, path, accept_encoding, extra_headers)
+            )
+            statusline = conn.file.readline()
+            if not statusline and conn.reused:
+                # The server closed the idle connection; retry on a fresh one.
+                pool.discard(conn)
+                continue
+            version, status, explanation = parse_statusline(statusline)
+            headers = read_headers(conn.file)
+            assert status in statuses, "{}: {}".format(status, explanation)
+
+            keep_alive = version == "HTTP/1.1"
+            if headers.get("connection", "").lower() == "close":
+                keep_alive = False
+            if status == "304":
+                # Never has a body, so the connection is ready for reuse.
+                chunks: Iterator[bytes] = empty_body()
+            else:
+                if not is_delimited(headers):
+                    keep_alive = False
+                chunks = read_body(conn.file, headers, chunk_size)
+        except BaseException:
+            pool.discard(conn)
+            raise
+        return status, headers, PooledBody(chunks, pool, conn, keep_alive)
+
+
+def empty_body() -> Generator[bytes, None, None]:
+    yield from ()
+
+
+def close_after(
+    chunks: Iterator[bytes], s: socket.socket
+) -> Generator[bytes, None, None]:
+    try:
+        yield from chunks
+    finally:
+        s.close()
+
+
+class PooledBody(Generator[bytes, None, None]):
+    """A response body read from a pooled connection.
+
+    The connection goes back to the pool once the body has been read to
+    the end. A body closed or dropped before then, even one that was never
+    started, leaves the connection in an unknown state, so it is discarded.
+    """
+
+    def __init__(
+        self,
+        chunks: Iterator[bytes],
+        pool: ConnectionPool,
+        conn: Connection,
+        keep_alive: bool,
+    ):
+        self.chunks = chunks
+        self.pool = pool
+        self.conn: Optional[Connection] = conn
+        self.keep_alive = keep_alive
+
+    def send(self, value: None) -> bytes:
+        if self.conn is None:
+            raise StopIteration
+        try:
+            return next(self.chunks)
+        except StopIteration:
+            self.finish(self.keep_alive)
+            raise
+        except BaseException:
+            self.finish(False)
+            raise
+
+    def throw(self, typ: Any, val: Any = None, tb: Any = None) -> bytes:
+        self.finish(False)
+        return super().throw(typ, val, tb)
+
+    def close(self) -> None:
+        self.finish(False)
+
+    def finish(self, reuse: bool) -> None:
+        conn, self.conn = self.conn, None
+        if conn is None:
+            return
+        if reuse:
+            self.pool.release(conn)
+        else:
+            self.pool.discard(conn)
+
+    def __del__(self) -> None:
+        self.finish(False)
+
+
+def header_charset(headers: Headers) -> Optional[str]:
+    for parameter in headers.get("content-type", "").split(";")[1:]:
+        name, _, value = parameter.strip().partition("=")
+        if name.lower() == "charset":
+            return value.strip().strip("\"'")
+    return None
+
+
+def choose_charset(headers: Headers, prefix: bytes) -> str:
+    # A byte order mark wins, then the Content-Type header, then a <meta>
+    # tag near the start of the body; names Python does not know are
+    # skipped.
+    for bom, charset in BOMS:
+        if prefix.startswith(bom):
+            return charset
+    candidates = [header_charset(headers)]
+    match = META_CHARSET.search(prefix[:SNIFF_SIZE])
+    if match:
+        candidates.append(match.group(1).decode("ascii"))
+    for candidate in candidates:
+        if not candidate:
+            continue
+        try:
+            return codecs.lookup(candidate).name
+        except LookupError:
+            continue
+    return DEFAULT_CHARSET
+
+
+def decode_body(headers: Headers, body: bytes) -> str:
+    # One bulk decode; bytes that are invalid in the charset become U+FFFD
+    # instead of failing the whole page.
+    return body.decode(choose_charset(headers, body[:SNIFF_SIZE]), "replace")
+
+
+def decode_stream(
+    headers: Headers, chunks: Generator[bytes, None, None]
+) -> Generator[str, None, None]:
+    # Holds back the start of the body until there is enough to sniff a
+    # charset from, then decodes incrementally.
+    prefix = b""
+    for chunk in chunks:
+        prefix += chunk
+        if len(prefix) >= SNIFF_SIZE:
+            break
+    yield from decode_chunks(
+        chunks, choose_charset(headers, prefix), prefix, errors="replace"
     )
-    response = s.makefile("r", encoding="utf8", newline="\r\n")
 
-    statusline = response.readline()
-    version, status, explanation = statusline.split(" ", 2)
-    assert status == "200", "{}: {}".format(status, explanation)
 
+def decode_chunks(
+    chunks: Generator[bytes, None, None],
+    encoding: str,
+    prefix: bytes = b"",
+    errors: str = "strict",
+) -> Generator[str, None, None]:
+    decoder = codecs.getincrementaldecoder(encoding)(errors)
+    try:
+        text = decoder.decode(prefix)
+        if text:
+            yield text
+        for chunk in chunks:
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+    finally:
+        chunks.close()
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+def request_head(
+    version: str,
+    host: str,
+    path: str,
+    accept_encoding: bool,
+    extra_headers: Optional[Headers] = None,
+) -> bytes:
+    head = "GET {} {}\r\n".format(path, version)
+    head += "Host: {}\r\n".format(host)
+    if version == "HTTP/1.1":
+        head += "Connection: keep-alive\r\n"
+    if accept_encoding:
+        head += "Accept-Encoding: {}\r\n".format(ACCEPT_ENCODING)
+    for header, value in (extra_headers or {}).items():
+        head += "{}: {}\r\n".format(header, value)
+    return (head + "\r\n").encode("utf8")
+
+
+def read_headers(response: io.BufferedIOBase) -> Headers:
     headers: Headers = {}
     while True:
         line = response.readline()
-        if line == "\r\n":
+        if line in [b"\r\n", b"\n", b""]:
             break
-        header, value = line.split(":", 1)
-        headers[header.lower()] = value.strip()
+        header, value = parse_header(line)
+        headers[header] = value
+    return headers
+
+
+def parse_statusline(line: bytes) -> Tuple[str, str, str]:
+    version, status, explanation = line.decode("latin1").split(" ", 2)
+    return version, status, explanation
+
+
+def parse_header(line: bytes) -> Tuple[str, str]:
+    header, value = line.decode("latin1").split(":", 1)
+    return header.lower(), value.strip()
+
+
+def is_delimited(headers: Headers) -> bool:
+    return "content-length" in headers or "transfer-encoding" in headers
+
+
+def read_body(
+    response: io.BufferedIOBase, headers: Headers, chunk_size: int = CHUNK_SIZE
+) -> Iterator[bytes]:
+    """Yield the decoded body as it arrives, undoing transfer and content codings."""
+    chunks: Iterator[bytes]
+    if headers.get("transfer-encoding", "identity").lower() == "chunked":
+        chunks = read_chunked(response, chunk_size)
+    elif "transfer-encoding" in headers:
+        raise AssertionError(
+            "Unsupported transfer-encoding {}".format(headers["transfer-encoding"])
+        )
+    elif "content-length" in headers:
+        chunks = read_length(response, int(headers["content-length"]), chunk_size)
+    else:
+        chunks = read_length(response, None, chunk_size)
+
+    encoding = headers.get("content-encoding", "identity").lower()
+    if encoding != "identity":
+        chunks = decompress(chunks, encoding, chunk_size)
+    return chunks
+
+
+def read_length(
+    response: io.BufferedIOBase, length: Optional[int], chunk_size: int = CHUNK_SIZE
+) -> Iterator[bytes]:
+    while length is None or length > 0:
+        size = chunk_size if length is None else min(length, chunk_size)
+        data = response.read1(size)
+        if not data:
+            assert length is None, "Connection closed with {} bytes left".format(length)
+            return
+        if length is not None:
+            length -= len(data)
+        yield data
+
+
+def read_chunked(
+    response: io.BufferedIOBase, chunk_size: int = CHUNK_SIZE
+) -> Iterator[bytes]:
+    while True:
+        line = response.readline()
+        assert line, "Connection closed inside chunked body"
+        size = int(line.split(b";", 1)[0], 16)
+        if size == 0:
+            break
+        yield from read_length(response, size, chunk_size)
+        response.readline()
+    # Trailer fields are read and dropped so the connection can be reused.
+    read_headers(response)
+
+
+class Decompressor:
+    def __init__(self, encoding: str, chunk_size: int = CHUNK_SIZE):
+        if encoding in ["gzip", "x-gzip"]:
+            self.zlib = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == "deflate":
+            self.zlib = zlib.decompressobj()
+        else:
+            raise AssertionError("Unsupported content-encoding {}".format(encoding))
+        self.chunk_size = chunk_size
+        # The start of a deflate body, kept until there is enough of it to
+        # check for the zlib header.
+        self.head: Optional[bytes] = b"" if encoding == "deflate" else None
+
+    def decompress(self, chunk: bytes) -> Iterator[bytes]:
+        if self.head is not None:
+            self.head += chunk
+            if len(self.head) < 2:
+                return
+            chunk, self.head = self.head, None
+            # Many servers send raw deflate data without the zlib wrapper.
+            if not is_zlib_header(chunk):
+                self.zlib = zlib.decompressobj(-zlib.MAX_WBITS)
+        while chunk:
+            # Output is capped at chunk_size so memory stays bounded.
+            data = self.zlib.decompress(chunk, self.chunk_size)
+            chunk = self.zlib.unconsumed_tail
+            if data:
+                yield data
+
+    def flush(self) -> bytes:
+        data = self.zlib.decompress(self.head) if self.head else b""
+        return data + self.zlib.flush()
+
 
-    assert "transfer-encoding" not in headers
-    assert "content-encoding" not in headers
+def is_zlib_header(data: bytes) -> bool:
+    # The compression method is deflate and the two bytes are a multiple
+    # of 31, as RFC 1950 requires.
+    return data[0] & 0x0F == 8 and (data[0] << 8 | data[1]) % 31 == 0
 
-    body = response.read()
-    s.close()
 
-    return headers, body
+def decompress(
+    chunks: Iterator[bytes], encoding: str, chunk_size: int = CHUNK_SIZE
+) -> Iterator[bytes]:
+    decompressor = Decompressor(encoding, chunk_size)
+    for chunk in chunks:
+        yield from decompressor.decompress(chunk)
+    data = decompressor.flush()
+    if data:
+        yield data
 
 
 def show(body: Body) -> None:
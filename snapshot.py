@@ -0,0 +1,181 @@
+import hashlib
+import itertools
+import os
+import struct
+import sys
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+from browser import DrawRect, DrawText
+from font import FontKey, backend_version, get_font
+from http_cache import write_file
+
+MAGIC = b"BEDL"
+FORMAT_VERSION = 2
+# Magic, format version, document height, then the number of strings,
+# fonts, commands and rectangles.
+HEADER = struct.Struct("<4sHdIIII")
+TEXT, RECT = 0, 1
+BOLD, ITALIC = 1, 2
+
+DisplayList = List[DrawText | DrawRect]
+
+
+def dumps(height: float, display_list: DisplayList) -> bytes:
+    # The display list is stored column by column, each column a typed
+    # array, so loading is a handful of array.frombytes calls. Words and
+    # colors go into one table of distinct strings, stored as their lengths
+    # and a single UTF-8 blob.
+    strings: Dict[str, int] = {}
+    fonts: Dict[FontKey, int] = {}
+    kinds = array("B")
+    refs = array("I")
+    font_refs = array("H")
+    lefts = array("d")
+    tops = array("d")
+    rights = array("d")
+    bottoms = array("d")
+    for cmd in display_list:
+        lefts.append(cmd.left)
+        tops.append(cmd.top)
+        if isinstance(cmd, DrawText):
+            kinds.append(TEXT)
+            refs.append(strings.setdefault(cmd.text, len(strings)))
+            font_refs.append(fonts.setdefault(cmd.font.key, len(fonts)))
+        else:
+            kinds.append(RECT)
+            refs.append(strings.setdefault(cmd.color, len(strings)))
+            font_refs.append(0)
+            rights.append(cmd.right)
+            bottoms.append(cmd.bottom)
+
+    lengths = array("I", [len(string) for string in strings])
+    blob = "".join(strings).encode("utf8")
+    # Nested <small> tags can take font sizes to zero and below.
+    sizes = array("h", [size for size, weight, slant in fonts])
+    styles = array(
+        "B",
+        [
+            (BOLD if weight == "bold" else 0) | (ITALIC if slant == "italic" else 0)
+            for size, weight, slant in fonts
+        ],
+    )
+    columns: List["array[Any]"] = [lengths, sizes, styles, kinds, refs, font_refs]
+    columns += [lefts, tops, rights, bottoms]
+    if sys.byteorder == "big":
+        for column in columns:
+            column.byteswap()
+
+    header = HEADER.pack(
+        MAGIC,
+        FORMAT_VERSION,
+        height,
+        len(strings),
+        len(fonts),
+        len(display_list),
+        len(rights),
+    )
+    return b"".join(
+        [header, struct.pack("<I", len(blob)), blob]
+        + [column.tobytes() for column in columns]
+    )
+
+
+def loads(data: bytes) -> Tuple[float, DisplayList]:
+    (
+        magic,
+        version,
+        height,
+        n_strings,
+        n_fonts,
+        n_commands,
+        n_rects,
+    ) = HEADER.unpack_from(data)
+    assert magic == MAGIC, "Not a display list snapshot"
+    assert version == FORMAT_VERSION, "Unknown snapshot version {}".format(version)
+    offset = HEADER.size
+    (blob_size,) = struct.unpack_from("<I", data, offset)
+    offset += 4
+    text = data[offset : offset + blob_size].decode("utf8")
+    offset += blob_size
+
+    def column(typecode: str, count: int) -> "array[Any]":
+        nonlocal offset
+        values = array(typecode)
+        size = values.itemsize * count
+        values.frombytes(data[offset : offset + size])
+        offset += size
+        if sys.byteorder == "big":
+            values.byteswap()
+        return values
+
+    lengths = column("I", n_strings)
+    sizes = column("h", n_fonts)
+    styles = column("B", n_fonts)
+    kinds = column("B", n_commands)
+    refs = column("I", n_commands)
+    font_refs = column("H", n_commands)
+    lefts = column("d", n_commands)
+    tops = column("d", n_commands)
+    rights = iter(column("d", n_rects))
+    bottoms = iter(column("d", n_rects))
+    assert offset == len(data), "Truncated display list snapshot"
+
+    ends = list(itertools.accumulate(lengths))
+    strings = [text[end - length : end] for end, length in zip(ends, lengths)]
+    fonts = [
+        get_font(
+            size,
+            "bold" if style & BOLD else "normal",
+            "italic" if style & ITALIC else "roman",
+        )
+        for size, style in zip(sizes, styles)
+    ]
+
+    # Layout puts boxes on whole pixels horizontally, so x coordinates are
+    # turned back into ints to give the same display list as a fresh layout.
+    display_list: DisplayList = []
+    for kind, ref, font_ref, left, top in zip(kinds, refs, font_refs, lefts, tops):
+        x1 = int(left) if left.is_integer() else left
+        if kind == TEXT:
+            display_list.append(DrawText(x1, top, strings[ref], fonts[font_ref]))
+        else:
+            right, bottom = next(rights), next(bottoms)
+            x2 = int(right) if right.is_integer() else right
+            display_list.append(DrawRect(x1, top, x2, bottom, strings[ref]))
+    return height, display_list
+
+
+class SnapshotCache:
+    # Laid-out pages on disk, keyed by everything the layout depends on: the
+    # body, the viewport width and how the font backend measures text.
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.failed = 0
+
+    def path(self, body: str, width: int) -> str:
+        key = hashlib.sha256(body.encode("utf8"))
+        key.update("\0{}\0{}".format(width, backend_version()).encode("utf8"))
+        return os.path.join(self.directory, key.hexdigest() + ".dl")
+
+    def load(self, body: str, width: int) -> Optional[Tuple[float, DisplayList]]:
+        try:
+            with open(self.path(body, width), "rb") as f:
+                snapshot = loads(f.read())
+        except (OSError, AssertionError, struct.error):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return snapshot
+
+    def store(
+        self, body: str, width: int, height: float, display_list: DisplayList
+    ) -> None:
+        # A page that cannot be stored is just laid out again next time.
+        try:
+            write_file(self.path(body, width), dumps(height, display_list))
+        except (OSError, OverflowError, struct.error):
+            self.failed += 1
@@ -4,26 +4,36 @@ This file contains unittests helpers for chapters 1-10
 
 import builtins
 import io
+import socket as socket_module
 import sys
 import tkinter
 import tkinter.font
 import unittest
 from unittest import mock
 
+original_socket = socket_module.socket
+
 class socket:
     URLs = {}
     Requests = {}
 
+    Connects = 0
+
     def __init__(self, *args, **kwargs):
         self.request = b""
         self.connected = False
+        self.answered = False
 
     def connect(self, host_port):
         self.scheme = "http"
         self.host, self.port = host_port
         self.connected = True
+        socket.Connects += 1
 
     def send(self, text):
+        if self.answered:
+            self.request = b""
+            self.answered = False
         self.request += text
         self.method, self.path, _ = self.request.decode("latin1").split(" ", 2)
         
@@ -34,7 +44,13 @@ class socket:
             assert all(int(value) == len(self.body) for name, value in headers
                        if name.lower() == "content-length")
 
-    def makefile(self, mode, encoding, newline):
+    def makefile(self, mode, encoding=None, newline=None):
+        if "b" in mode:
+            return SocketFile(self)
+        output = self.response()
+        return io.StringIO(output.decode(encoding).replace(newline, "\n"), newline)
+
+    def response(self):
         assert self.connected and self.host and self.port
         if self.port == 80 and self.scheme == "http":
             url = self.scheme + "://" + self.host + self.path
@@ -47,7 +63,11 @@ class socket:
         output = self.URLs[url][1]
         if self.URLs[url][2]:
             assert self.body == self.URLs[url][2], (self.body, self.URLs[url][2])
-        return io.StringIO(output.decode(encoding).replace(newline, "\n"), newline)
+        self.answered = True
+        return output
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
 
     def close(self):
         self.connected = False
@@ -77,16 +97,64 @@ class socket:
     def clear_history(cls):
         cls.Requests = {}
 
+class SocketFile:
+    """Binary file over a mock socket; answers each request as it is read."""
+
+    def __init__(self, s):
+        self.socket = s
+        self.buffer = b""
+
+    def fill(self):
+        if not self.buffer and self.socket.request and not self.socket.answered:
+            self.buffer = self.socket.response()
+
+    def readline(self, limit=-1):
+        self.fill()
+        end = self.buffer.find(b"\n") + 1 or len(self.buffer)
+        if limit >= 0:
+            end = min(end, limit)
+        line, self.buffer = self.buffer[:end], self.buffer[end:]
+        return line
+
+    def read(self, n=-1):
+        self.fill()
+        if n is None or n < 0:
+            n = len(self.buffer)
+        data, self.buffer = self.buffer[:n], self.buffer[n:]
+        return data
+
+    def read1(self, n=-1):
+        return self.read(n)
+
+    def close(self):
+        pass
+
 class ssl:
-    def wrap_socket(self, s, server_hostname):
+    def wrap_socket(self, s, server_hostname, session=None):
         assert s.host == server_hostname
         s.scheme = "https"
+        s.offered_session = session
         return s
 
     @classmethod
     def patch(cls):
         return mock.patch("ssl.create_default_context", wraps=cls)
 
+class resolver:
+    """Stub DNS: every host resolves to itself, so mock sockets see host names."""
+
+    Lookups = 0
+
+    @classmethod
+    def getaddrinfo(cls, host, port, family=0, type=0, proto=0, flags=0):
+        cls.Lookups += 1
+        return [(socket_module.AF_INET, socket_module.SOCK_STREAM,
+                 socket_module.IPPROTO_TCP, "", (host, port))]
+
+    @classmethod
+    def patch(cls):
+        return mock.patch("socket.getaddrinfo", cls.getaddrinfo)
+
 class SilentTk:
     def bind(self, event, callback):
         pass
@@ -112,12 +180,18 @@ class SilentCanvas:
     def create_polygon(self, *args, **kwargs):
         pass
 
-    def pack(self):
+    def pack(self, **kwargs):
         pass
 
     def delete(self, v):
         pass
 
+    def move(self, tag, dx, dy):
+        pass
+
+    def tag_lower(self, tag, below=None):
+        pass
+
 tkinter.Canvas = SilentCanvas
 
 class MockCanvas:
@@ -0,0 +1,109 @@
+# mypy: ignore-errors
+
+import asyncio
+import contextlib
+import gzip
+import test
+from typing import Dict, Iterator, List, Optional, Tuple
+from unittest import mock
+
+from async_request import AsyncFetcher, fetch_all
+
+RESPONSES: Dict[Tuple[str, int], bytes] = {}
+
+
+class Writer:
+    def __init__(self) -> None:
+        self.data = b""
+
+    def write(self, data: bytes) -> None:
+        self.data += data
+
+    async def drain(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class Server:
+    def __init__(self) -> None:
+        self.active: Dict[str, int] = {}
+        self.peak: Dict[str, int] = {}
+        self.peak_total = 0
+        self.opened: List[str] = []
+        self.requests: List[bytes] = []
+
+    async def open_connection(
+        self,
+        host: str,
+        port: int,
+        ssl: Optional[object] = None,
+        server_hostname: Optional[str] = None,
+    ) -> Tuple[asyncio.StreamReader, Writer]:
+        self.active[host] = self.active.get(host, 0) + 1
+        self.peak[host] = max(self.peak.get(host, 0), self.active[host])
+        self.peak_total = max(self.peak_total, sum(self.active.values()))
+        self.opened.append(host)
+        await asyncio.sleep(0.01)
+        self.active[host] -= 1
+
+        reader = asyncio.StreamReader()
+        reader.feed_data(RESPONSES[(host, port)])
+        reader.feed_eof()
+        return reader, Writer()
+
+
+@contextlib.contextmanager
+def patch_connection(server: Server) -> Iterator[None]:
+    # The event loop needs real sockets even while test_request mocks them.
+    with mock.patch("socket.socket", test.original_socket):
+        with mock.patch("asyncio.open_connection", server.open_connection):
+            yield
+
+
+def test_fetch() -> None:
+    RESPONSES[
+        ("a.test", 80)
+    ] = b"HTTP/1.0 200 OK\r\nHeader1: Value1\r\n\r\n" + "café".encode("utf8")
+    RESPONSES[("b.test", 443)] = (
+        b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n"
+        + b"Content-Encoding: gzip\r\n\r\n"
+        + b"%x\r\n" % len(gzip.compress(b"zipped"))
+        + gzip.compress(b"zipped")
+        + b"\r\n0\r\n\r\n"
+    )
+    RESPONSES[("c.test", 80)] = b"HTTP/1.0 404 Not Found\r\n\r\n"
+
+    server = Server()
+    with patch_connection(server):
+        results = fetch_all(
+            ["http://a.test/", "https://b.test/x", "http://c.test/"],
+            accept_encoding=True,
+        )
+    assert results[0] == ({"header1": "Value1"}, "café")
+    assert results[1] == (
+        {"transfer-encoding": "chunked", "content-encoding": "gzip"},
+        "zipped",
+    )
+    assert isinstance(results[2], AssertionError)
+
+
+def test_concurrency_limits() -> None:
+    RESPONSES[("d.test", 80)] = b"HTTP/1.0 200 OK\r\n\r\nd"
+    RESPONSES[("e.test", 80)] = b"HTTP/1.0 200 OK\r\n\r\ne"
+    urls = ["http://d.test/"] * 10 + ["http://e.test/"] * 10
+
+    server = Server()
+
+    async def run() -> None:
+        fetcher = AsyncFetcher(max_connections=3, max_per_host=2)
+        results = await fetcher.fetch_all(urls)
+        assert [body for headers, body in results] == ["d"] * 10 + ["e"] * 10
+
+    with patch_connection(server):
+        asyncio.run(run())
+    assert server.peak == {"d.test": 2, "e.test": 2}
+    assert server.peak_total == 3
+    # Requests waiting for d.test do not hold up e.test.
+    assert server.opened[:4] == ["d.test", "d.test", "e.test", "e.test"]
@@ -0,0 +1,74 @@
+import json
+import pathlib
+from unittest import mock
+
+import pytest
+
+import batch
+from batch import main, render_all
+
+
+def test_render_all(tmp_path: pathlib.Path) -> None:
+    page = tmp_path / "page.html"
+    page.write_text("<p>hello <b>world</b></p><pre>code</pre>")
+    results = list(
+        render_all(
+            [str(page), "file://" + str(page), str(tmp_path / "missing")], processes=2
+        )
+    )
+    assert [result["url"] for result in results] == [
+        str(page),
+        "file://" + str(page),
+        str(tmp_path / "missing"),
+    ]
+    assert results[0]["display_list"] == results[1]["display_list"]
+    texts = [cmd for cmd in results[0]["display_list"] if cmd["type"] == "text"]
+    assert [cmd["text"] for cmd in texts] == ["hello", "world", "code"]
+    assert texts[1]["font"] == [16, "bold", "roman"]
+    assert set(results[0]["timings"]) == {"fetch", "parse", "layout", "paint", "total"}
+    assert results[2]["error"].startswith("FileNotFoundError")
+
+
+def test_main(tmp_path: pathlib.Path, capsys: pytest.CaptureFixture[str]) -> None:
+    page = tmp_path / "page.html"
+    page.write_text("<p>hello</p>")
+    listing = tmp_path / "urls.txt"
+    listing.write_text(str(page) + "\n\n" + str(page) + "\n")
+    output = tmp_path / "out.jsonl"
+    main(["-i", str(listing), "-o", str(output), "-j", "1"])
+    lines = output.read_text().splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[0])["display_list"][0]["text"] == "hello"
+    assert "2 pages, 0 failed" in capsys.readouterr().err
+
+
+def test_snapshots(tmp_path: pathlib.Path) -> None:
+    page = tmp_path / "page.html"
+    page.write_text("<p>hello <b>world</b></p><pre>code</pre>")
+    snapshots = str(tmp_path / "snapshots")
+    first, second = [
+        next(render_all([str(page)], processes=1, snapshots=snapshots))
+        for _ in range(2)
+    ]
+    assert "parse" in first["timings"]
+    assert set(second["timings"]) == {"fetch", "snapshot", "total"}
+    assert json.dumps(second["display_list"]) == json.dumps(first["display_list"])
+    assert second["height"] == first["height"]
+
+    tiny = tmp_path / "tiny.html"
+    tiny.write_text("<small>" * 9 + "tiny")
+    result = next(render_all([str(tiny)], processes=1, snapshots=snapshots))
+    assert "error" not in result
+
+
+def test_connect_timeout() -> None:
+    with mock.patch("batch.set_backend"):
+        batch.init_worker("monospace", connect_timeout=2.5)
+    try:
+        with mock.patch("batch.request", return_value=({}, "<p>hi</p>")) as request:
+            assert batch.fetch("http://batch.test/") == "<p>hi</p>"
+        request.assert_called_once_with(
+            "http://batch.test/", accept_encoding=True, connect_timeout=2.5
+        )
+    finally:
+        batch.CONNECT_TIMEOUT = None
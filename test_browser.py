@@ -0,0 +1,315 @@
+# mypy: ignore-errors
+
+import random
+import test
+from unittest import mock
+
+from browser import (
+    HEIGHT,
+    Browser,
+    DisplayListIndex,
+    DocumentLayout,
+    DrawRect,
+    InlineLayout,
+    LoadToken,
+    layout_mode,
+)
+from html_parser import HTMLParser, Text, mark_dirty
+
+test.socket.patch().start()
+test.ssl.patch().start()
+test.resolver.patch().start()
+
+
+class Window:
+    def __init__(self):
+        self.callbacks = []
+
+    def after(self, ms, callback):
+        self.callbacks.append(callback)
+
+    def run_pending(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+class Canvas:
+    def __init__(self):
+        self.items = {}
+        self.next_id = 1
+        self.calls = 0
+
+    def create(self, y):
+        self.calls += 1
+        self.items[self.next_id] = y
+        self.next_id += 1
+        return self.next_id - 1
+
+    def create_text(self, x, y, **kwargs):
+        return self.create(y)
+
+    def create_rectangle(self, x1, y1, x2, y2, **kwargs):
+        return self.create(y1)
+
+    def move(self, tag, dx, dy):
+        self.calls += 1
+        for item in self.items:
+            self.items[item] += dy
+
+    def delete(self, item):
+        self.calls += 1
+        if item == "all":
+            self.items = {}
+        else:
+            del self.items[item]
+
+    def tag_lower(self, item, below):
+        self.calls += 1
+
+
+def make_browser():
+    browser = Browser()
+    browser.window = Window()
+    return browser
+
+
+def test_background_load() -> None:
+    url = "http://browser.test/page"
+    test.socket.respond_ok(url, "<p>hello world</p>")
+    browser = make_browser()
+    browser.scrolldown(None)
+    browser.load(url)
+    assert browser.document is None
+    browser.thread.join()
+    browser.window.run_pending()
+    assert [cmd.text for cmd in browser.display_list] == ["hello", "world"]
+    assert browser.loading is None
+    assert browser.window.callbacks == []
+
+
+def test_newer_load_cancels_older() -> None:
+    first = "http://browser.test/first"
+    second = "http://browser.test/second"
+    test.socket.respond_ok(first, "<p>first</p>")
+    test.socket.respond_ok(second, "<p>second</p>")
+    browser = make_browser()
+    browser.load(first)
+    first_thread = browser.thread
+    browser.load(second)
+    first_thread.join()
+    browser.thread.join()
+    browser.window.run_pending()
+    assert [cmd.text for cmd in browser.display_list] == ["second"]
+    assert len(browser.window.callbacks) == 0
+
+
+def test_failed_load(capsys) -> None:
+    url = "http://browser.test/missing"
+    test.socket.respond(url, b"HTTP/1.0 404 Not Found\r\n\r\n")
+    browser = make_browser()
+    browser.load(url)
+    browser.thread.join()
+    browser.window.run_pending()
+    assert browser.document is None
+    assert "Failed to load" in capsys.readouterr().out
+
+
+def test_progressive_load() -> None:
+    browser = make_browser()
+    browser.loading = token = LoadToken("http://browser.test/slow")
+    browser.results.put((token, "<p>first</p><p>sec", None))
+    browser.poll()
+    assert [cmd.text for cmd in browser.display_list] == ["first"]
+    assert set(browser.timings) == {"first_paint"}
+    document = browser.document
+
+    browser.results.put((token, "ond</p>", None))
+    browser.results.put((token, None, None))
+    browser.poll()
+    assert [cmd.text for cmd in browser.display_list] == ["first", "second"]
+    assert browser.document is document
+    assert browser.loading is None
+    assert browser.timings["layout"] >= browser.timings["first_paint"]
+
+
+def test_poll_budget() -> None:
+    browser = make_browser()
+    browser.loading = token = LoadToken("http://browser.test/slow")
+    for i in range(10):
+        browser.results.put((token, "<p>{}</p>".format(i), None))
+    browser.results.put((token, None, None))
+    with mock.patch("browser.POLL_BUDGET", 0):
+        browser.poll()
+        assert browser.received == len("<p>0</p>")
+        assert browser.results.qsize() == 10
+        assert browser.window.callbacks == [browser.poll]
+        for i in range(10):
+            browser.window.run_pending()
+    assert browser.loading is None
+    assert [cmd.text for cmd in browser.display_list] == [str(i) for i in range(10)]
+
+
+def test_load_without_progressive() -> None:
+    url = "http://browser.test/whole"
+    test.socket.respond_ok(url, "<p>first</p><p>second</p>")
+    browser = Browser(progressive=False)
+    browser.window = Window()
+    browser.load(url)
+    browser.thread.join()
+    # The worker hands over the finished DOM rather than chunks.
+    token, nodes, error = browser.results.queue[0]
+    assert nodes.tag == "html" and error is None
+    browser.window.run_pending()
+    assert [cmd.text for cmd in browser.display_list] == ["first", "second"]
+    assert browser.timings["first_paint"] == browser.timings["layout"]
+    assert browser.loading is None
+
+
+def test_display_list_index() -> None:
+    rng = random.Random(0)
+    display_list = []
+    for i in range(2000):
+        top = rng.uniform(0, 50000)
+        height = rng.choice([18, 18, 18, 200, 3 * HEIGHT])
+        display_list.append(DrawRect(0, top, 10, top + height, "gray"))
+    index = DisplayListIndex(display_list)
+    assert index.tall
+    for scroll in [0, 1000, 25000.5, 49900, 60000]:
+        expected = [
+            cmd
+            for cmd in display_list
+            if cmd.top <= scroll + HEIGHT and cmd.bottom >= scroll
+        ]
+        assert index.query(scroll, scroll + HEIGHT) == expected
+
+
+def test_retained_draw() -> None:
+    url = "http://browser.test/long"
+    test.socket.respond_ok(url, "<p>line</p>" * 500)
+    browser = make_browser()
+    browser.canvas = Canvas()
+    browser.load(url)
+    browser.thread.join()
+    browser.window.run_pending()
+
+    def check():
+        expected = browser.index.query(browser.scroll, browser.scroll + HEIGHT)
+        tops = sorted(browser.canvas.items.values())
+        assert tops == [cmd.top - browser.scroll for cmd in expected]
+
+    check()
+    visible = len(browser.canvas.items)
+    for _ in range(5):
+        browser.canvas.calls = 0
+        browser.scrolldown(None)
+        check()
+        # One move plus a create and delete per line scrolled past.
+        assert browser.canvas.calls < visible
+
+
+def paint(document):
+    display_list = []
+    document.paint(display_list)
+    return [(cmd.top, cmd.left, getattr(cmd, "text", None)) for cmd in display_list]
+
+
+def test_incremental_layout() -> None:
+    body = "<p>first</p><div><p>second</p><pre>third</pre></div>" * 20
+    nodes = HTMLParser(body).parse()
+    document = DocumentLayout(nodes)
+    document.layout()
+    before = paint(document)
+
+    with mock.patch.object(
+        InlineLayout, "text", autospec=True, side_effect=InlineLayout.text
+    ) as text:
+        document.layout()
+        assert text.call_count == 0
+    assert paint(document) == before
+
+    first = nodes.children[0].children[0].children[0]
+    first.text = "first " * 100
+    mark_dirty(first)
+    assert nodes.dirty
+    with mock.patch.object(
+        InlineLayout, "text", autospec=True, side_effect=InlineLayout.text
+    ) as text:
+        document.layout()
+        assert [call.args[1] for call in text.call_args_list] == [first]
+    assert not nodes.dirty and not first.dirty
+
+    fresh = DocumentLayout(HTMLParser(body.replace("first", "first " * 100, 1)).parse())
+    fresh.layout()
+    assert paint(document) == paint(fresh)
+    assert document.height == fresh.height > before[-1][0]
+
+
+def test_resize_reuses_line_breaks() -> None:
+    body = "<p>" + "word " * 200 + "</p><pre>a  b</pre>"
+    nodes = HTMLParser(body).parse()
+    document = DocumentLayout(nodes, 800)
+    document.layout()
+    wide = paint(document)
+
+    document.viewport_width = 400
+    document.layout()
+    narrow = paint(document)
+    assert narrow != wide
+
+    fresh = DocumentLayout(HTMLParser(body).parse(), 400)
+    fresh.layout()
+    assert narrow == paint(fresh)
+
+    document.viewport_width = 800
+    with mock.patch.object(
+        InlineLayout, "text", autospec=True, side_effect=InlineLayout.text
+    ) as text:
+        document.layout()
+        assert text.call_count == 0
+    assert paint(document) == wide
+
+
+def test_resize_event() -> None:
+    browser = make_browser()
+    browser.show(HTMLParser("<p>" + "word " * 200 + "</p>").parse())
+    height = browser.document.height
+
+    class Event:
+        widget = browser.window
+        width, height = 400, 300
+
+    browser.resize(Event())
+    assert (browser.width, browser.height) == (400, 300)
+    assert browser.document.viewport_width == 400
+    assert browser.document.height > height
+
+
+def test_line_metrics() -> None:
+    # "bbb" does not fit after "aaa", so the first line must not be spaced
+    # for the bigger font.
+    nodes = HTMLParser("<p>aaa <big>bbb ccc</big> ddd</p>").parse()
+    document = DocumentLayout(nodes, 2 * 13 + 100)
+    document.layout()
+    assert paint(document) == [
+        (18 + 3, 13, "aaa"),
+        (18 + 23.75, 13, "bbb"),
+        (18 + 48.75, 13, "ccc"),
+        (18 + 73, 13, "ddd"),
+    ]
+
+
+def test_layout_mode_cache() -> None:
+    parser = HTMLParser()
+    parser.feed("<div><b>bold</b>")
+    div = parser.root().children[0].children[0]
+    assert layout_mode(div) == "inline"
+    assert div.mode == "inline"
+
+    parser.feed("<p>block</p>")
+    assert div.mode is None
+    assert layout_mode(div) == "block"
+
+    div.children = [Text("text", div)]
+    mark_dirty(div)
+    assert layout_mode(div) == "inline"
@@ -0,0 +1,28 @@
+import pytest
+
+from dom_arena import DOMArena
+from html_parser import HTMLParser, print_tree
+
+
+def test_from_tree(capsys: pytest.CaptureFixture[str]) -> None:
+    tree = HTMLParser(
+        "<title>t</title><div id=a>one<b>two</b>three</div><p>four<br>five</p>"
+    ).parse()
+    print_tree(tree)
+    expected = capsys.readouterr().out
+
+    arena = DOMArena.from_tree(tree)
+    assert len(arena) == 14
+    root = arena.root()
+    print_tree(root)  # type: ignore
+    assert capsys.readouterr().out == expected
+
+    body = root.children[1]
+    assert body.tag == "body"
+    assert body.parent == root
+    assert root.parent is None
+    div = body.children[0]
+    assert div.attributes == {"id": "a"}
+    assert [child.is_text for child in div.children] == [True, False, True]
+    assert div.children[0].text == "one"
+    assert div.children[1].children[0].parent == div.children[1]
@@ -1,4 +1,18 @@
-from font import get_font
+# mypy: ignore-errors
+
+import pathlib
+import test  # noqa: F401
+
+from font import (
+    GlyphTableBackend,
+    MonospaceBackend,
+    MonospaceFont,
+    TkBackend,
+    WidthCache,
+    generate_glyph_tables,
+    get_font,
+    set_backend,
+)
 
 
 def test_get_font() -> None:
@@ -9,3 +23,66 @@ def test_get_font() -> None:
     assert a is b
     assert a is not c
     assert a is not d
+
+
+def test_font_handle() -> None:
+    font = get_font(16, "normal", "roman")
+    assert font.key == (16, "normal", "roman")
+    assert (font.ascent, font.descent, font.linespace) == (12, 4, 16)
+    assert font.space == 16
+    assert font.measure("hello") == 80
+
+
+def test_width_cache() -> None:
+    cache = WidthCache(maxsize=2)
+    font = get_font(16, "normal", "roman")
+    assert cache.measure(font, "hello") == 80
+    assert cache.measure(font, "hello") == 80
+    assert cache.measure(get_font(20, "normal", "roman"), "hello") == 100
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert cache.hit_rate() == 1 / 3
+
+    cache.measure(font, "hello")
+    cache.measure(font, "world")
+    assert list(cache.widths) == [(font.key, "hello"), (font.key, "world")]
+
+    cache.clear()
+    assert (cache.hits, cache.misses, len(cache.widths)) == (0, 0, 0)
+
+
+def test_measure_words() -> None:
+    cache = WidthCache()
+    font = get_font(16, "normal", "roman")
+    assert cache.measure_words(font, ["a", "bb", "a", "ccc"]) == [16, 32, 16, 48]
+    assert (cache.hits, cache.misses) == (1, 3)
+    assert cache.measure_words(font, []) == []
+
+
+def test_monospace_backend() -> None:
+    try:
+        set_backend(MonospaceBackend())
+        font = get_font(20, "bold", "italic")
+        assert isinstance(font.font, MonospaceFont)
+        assert font.measure("hello") == 5 * 12
+        assert (font.ascent, font.descent, font.linespace) == (18, 5, 23)
+    finally:
+        set_backend(TkBackend())
+    assert not isinstance(get_font(20, "bold", "italic").font, MonospaceFont)
+
+
+def test_glyph_table_backend(tmp_path: pathlib.Path) -> None:
+    path = str(tmp_path / "glyphs.json")
+    generate_glyph_tables(path, sizes=[10, 20])
+    backend = GlyphTableBackend.load(path)
+    try:
+        set_backend(backend)
+        font = get_font(20, "normal", "roman")
+        assert font.measure("hello") == 100
+        assert font.measure("☃") == 20
+        assert (font.ascent, font.descent, font.linespace) == (15, 5, 20)
+
+        font = get_font(40, "bold", "roman")
+        assert font.measure("hi") == 80
+        assert font.linespace == 40
+    finally:
+        set_backend(TkBackend())
@@ -1,6 +1,6 @@
 import pytest
 
-from html_parser import HTMLParser, print_tree
+from html_parser import EMPTY_ATTRIBUTES, Element, HTMLParser, print_tree
 
 
 def test_html_parser(capsys: pytest.CaptureFixture[str]) -> None:
@@ -75,3 +75,124 @@ def test_html_parser(capsys: pytest.CaptureFixture[str]) -> None:
        'text'
 """
     )
+
+
+def test_feed(capsys: pytest.CaptureFixture[str]) -> None:
+    body = (
+        "<!doctype html><title>t</title><div class=a>hello <b>bold</b> world"
+        "</div><p>one<br>two</p>tail"
+    )
+    print_tree(HTMLParser(body).parse())
+    expected = capsys.readouterr().out
+
+    for split in range(len(body) + 1):
+        parser = HTMLParser()
+        parser.feed(body[:split])
+        parser.feed(body[split:])
+        print_tree(parser.close())
+        assert capsys.readouterr().out == expected
+
+    parser = HTMLParser()
+    for c in body:
+        parser.feed(c)
+    print_tree(parser.close())
+    assert capsys.readouterr().out == expected
+
+
+def test_partial_tree(capsys: pytest.CaptureFixture[str]) -> None:
+    parser = HTMLParser()
+    assert parser.root() is None
+    parser.feed("<div>first</div><div>sec")
+    root = parser.root()
+    assert root is not None
+    print_tree(root)
+    captured = capsys.readouterr()
+    assert (
+        captured.out
+        == """ <html>
+   <body>
+     <div>
+       'first'
+     <div>
+"""
+    )
+    assert [node.tag for node in parser.unfinished] == ["html", "body", "div"]
+
+    parser.feed("ond</div>")
+    assert parser.close() is root
+    print_tree(root)
+    captured = capsys.readouterr()
+    assert captured.out.endswith(
+        """     <div>
+       'second'
+"""
+    )
+
+
+def test_implicit_tags(capsys: pytest.CaptureFixture[str]) -> None:
+    parser = HTMLParser("<meta><title>t</title>text<div>" * 2)
+    print_tree(parser.parse())
+    captured = capsys.readouterr()
+    assert (
+        captured.out
+        == """ <html>
+   <head>
+     <meta>
+     <title>
+       't'
+   <body>
+     'text'
+     <div>
+       <meta>
+       <title>
+         't'
+       'text'
+       <div>
+"""
+    )
+
+    depth = 1000
+    parser = HTMLParser("<div>" * depth + "deep")
+    node = parser.parse()
+    tags = []
+    while isinstance(node, Element):
+        tags.append(node.tag)
+        node = node.children[0]
+    assert tags == ["html", "body"] + ["div"] * depth
+
+
+def test_interned_names() -> None:
+    root = HTMLParser(
+        "<DIV Class=a>one</div><div class=b><Span>two</span><span></span></div>"
+    ).parse()
+    assert isinstance(root, Element)
+    body = root.children[0]
+    assert isinstance(body, Element)
+    first, second = body.children
+    assert isinstance(first, Element) and isinstance(second, Element)
+    assert first.tag is second.tag
+    assert list(first.attributes)[0] is list(second.attributes)[0]
+
+    span1, span2 = second.children
+    assert isinstance(span1, Element) and isinstance(span2, Element)
+    assert span1.tag == "span"
+    assert span1.attributes is span2.attributes is EMPTY_ATTRIBUTES
+    with pytest.raises(TypeError):
+        span1.attributes["id"] = "x"  # type: ignore
+
+
+def test_feed_marks_dirty() -> None:
+    parser = HTMLParser()
+    parser.feed("<div>first</div><div>sec")
+    root = parser.root()
+    assert isinstance(root, Element)
+    body = root.children[0]
+    assert isinstance(body, Element)
+    first, second = body.children
+    assert isinstance(first, Element)
+    for node in [root, body, first, first.children[0], second]:
+        node.dirty = False
+
+    parser.feed("ond</div><p>")
+    assert root.dirty and body.dirty and second.dirty
+    assert not first.dirty
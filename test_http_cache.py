@@ -0,0 +1,165 @@
+# mypy: ignore-errors
+
+import gzip
+import mmap
+import os
+import test
+from unittest import mock
+
+from http_cache import HTTPCache, parse_cache_control, split_body
+from request import ConnectionPool
+
+test.socket.patch().start()
+test.ssl.patch().start()
+test.resolver.patch().start()
+
+
+def respond(url, headers, body=""):
+    head = "".join(["{}: {}\r\n".format(k, v) for k, v in headers.items()])
+    response = "HTTP/1.1 200 OK\r\nContent-Length: {}\r\n{}\r\n{}".format(
+        len(body.encode("utf8")), head, body
+    )
+    test.socket.respond(url, response.encode("utf8"))
+
+
+def requests(url):
+    return len(test.socket.Requests.get(url, []))
+
+
+def test_parse_cache_control() -> None:
+    headers = {"cache-control": 'max-age=60, No-Store, private="x"'}
+    assert parse_cache_control(headers) == {
+        "max-age": "60",
+        "no-store": None,
+        "private": "x",
+    }
+    assert parse_cache_control({}) == {}
+
+
+def test_max_age(tmp_path) -> None:
+    url = "http://cache.test/fresh"
+    respond(url, {"Cache-Control": "max-age=3600"}, "hello")
+    cache = HTTPCache(str(tmp_path))
+    before = requests(url)
+    assert cache.request(url)[1] == "hello"
+    assert cache.request(url)[1] == "hello"
+    assert requests(url) == before + 1
+
+    # A new cache on the same directory finds the response on disk.
+    cache = HTTPCache(str(tmp_path))
+    headers, body = cache.request(url)
+    assert body == "hello"
+    assert headers["cache-control"] == "max-age=3600"
+    assert requests(url) == before + 1
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_no_store(tmp_path) -> None:
+    url = "http://cache.test/private"
+    respond(url, {"Cache-Control": "no-store", "ETag": '"1"'}, "secret")
+    cache = HTTPCache(str(tmp_path))
+    before = requests(url)
+    cache.request(url)
+    cache.request(url)
+    assert requests(url) == before + 2
+    assert os.listdir(tmp_path) == []
+
+
+def test_revalidate(tmp_path) -> None:
+    url = "http://cache.test/etag"
+    respond(
+        url,
+        {
+            "Cache-Control": "max-age=0",
+            "ETag": '"v1"',
+            "Last-Modified": "Mon, 05 Oct 2026 10:00:00 GMT",
+        },
+        "version one",
+    )
+    pool = ConnectionPool()
+    cache = HTTPCache(str(tmp_path))
+    assert cache.request(url, pool)[1] == "version one"
+    connects = test.socket.Connects
+
+    test.socket.respond(
+        url, b'HTTP/1.1 304 Not Modified\r\nETag: "v1"\r\nX-New: yes\r\n\r\n'
+    )
+    headers, body = cache.request(url, pool)
+    assert body == "version one"
+    assert headers["x-new"] == "yes"
+    assert headers["content-length"] == "11"
+    request = test.socket.last_request(url).decode("latin1")
+    assert 'If-None-Match: "v1"\r\n' in request
+    assert "If-Modified-Since: Mon, 05 Oct 2026 10:00:00 GMT\r\n" in request
+    assert cache.revalidated == 1
+
+    respond(url, {"Cache-Control": "max-age=0", "ETag": '"v2"'}, "version two")
+    assert cache.request(url, pool)[1] == "version two"
+    assert cache.request(url, pool)[1] == "version two"
+    assert '"v2"' in test.socket.last_request(url).decode("latin1")
+    # A 304 has no body, so its connection was kept for the next request.
+    assert test.socket.Connects == connects
+
+
+def test_memory_map(tmp_path) -> None:
+    url = "http://cache.test/big"
+    respond(url, {"Cache-Control": "max-age=3600"}, "x" * 1000)
+    HTTPCache(str(tmp_path)).request(url)
+
+    cache = HTTPCache(str(tmp_path), memory_size=100)
+    entry, body = cache.lookup(url)
+    assert isinstance(body, mmap.mmap)
+    assert body[:3] == b"xxx" and len(body) == entry.size == 1000
+    assert not cache.memory
+    assert cache.request(url)[1] == "x" * 1000
+
+    # The mapping is closed once the body has been read.
+    with mock.patch("http_cache.split_body", wraps=split_body) as split:
+        headers, chunks = cache.stream_bytes(url, chunk_size=300)
+    mapped = split.call_args.args[0]
+    assert isinstance(mapped, mmap.mmap) and not mapped.closed
+    assert b"".join(chunks) == b"x" * 1000
+    assert mapped.closed
+
+
+def test_decoded_headers(tmp_path) -> None:
+    url = "http://cache.test/gzip"
+    data = gzip.compress(b"<p>compressed</p>" * 100)
+    test.socket.respond(
+        url,
+        b"HTTP/1.1 200 OK\r\nCache-Control: max-age=3600\r\n"
+        + b"Content-Encoding: gzip\r\n"
+        + "Content-Length: {}\r\n\r\n".format(len(data)).encode("latin1")
+        + data,
+    )
+    HTTPCache(str(tmp_path)).request(url, accept_encoding=True)
+
+    # The cache keeps the body decoded, so its headers say so.
+    headers, body = HTTPCache(str(tmp_path)).request(url, accept_encoding=True)
+    assert body == "<p>compressed</p>" * 100
+    assert "content-encoding" not in headers
+    assert headers["content-length"] == str(len(body))
+
+
+def test_eviction(tmp_path) -> None:
+    cache = HTTPCache(str(tmp_path), max_size=250, memory_size=0)
+    urls = ["http://cache.test/{}".format(i) for i in range(4)]
+    for i, url in enumerate(urls):
+        respond(url, {"Cache-Control": "max-age=3600"}, str(i) * 100)
+
+    def use(url, when):
+        cache.request(url)
+        # Make the order of use visible to the file times.
+        os.utime(cache.path(url) + ".json", (when, when))
+
+    use(urls[0], 1)
+    use(urls[1], 2)
+    use(urls[0], 3)
+    use(urls[2], 4)
+    assert cache.disk_used == 200
+    use(urls[0], 5)
+    use(urls[3], 6)
+    assert cache.disk_used == 200
+    on_disk = sorted([entry.url for entry, base, used in cache.disk_entries()])
+    assert on_disk == [urls[0], urls[3]]
+    assert not cache.memory
@@ -1,13 +1,31 @@
 # mypy: ignore-errors
 
+import gzip
+import socket
 import test
+import threading
+import time
+import zlib
+from unittest import mock
 
 import pytest
 
-from request import request, show
+from request import (
+    ConnectionPool,
+    Resolver,
+    choose_charset,
+    create_connection,
+    decode_body,
+    request,
+    request_bytes,
+    show,
+    stream,
+    stream_bytes,
+)
 
 test.socket.patch().start()
 test.ssl.patch().start()
+test.resolver.patch().start()
 
 
 def test_show(capsys: pytest.CaptureFixture[str]) -> None:
@@ -51,6 +69,13 @@ def test_request() -> None:
     test.socket.respond(
         url, b"HTTP/1.0 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n0\r\n\r\n"
     )
+    headers, body = request(url)
+    assert body == ""
+
+    url = "http://test.test/te2"
+    test.socket.respond(
+        url, b"HTTP/1.0 200 OK\r\nTransfer-Encoding: gzip\r\n\r\n\x00\r\n\r\n"
+    )
     assert test.errors(request, url)
 
     url = "http://test.test/ce"
@@ -72,3 +97,346 @@ def test_ssl_support() -> None:
     assert body == "Hi"
 
     assert test.errors(request, "https://test.test:401/example3")
+
+
+def test_keepalive() -> None:
+    pool = ConnectionPool()
+    url = "http://keepalive.test/a"
+    test.socket.respond(
+        url,
+        b"HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nhello",
+    )
+    connects = test.socket.Connects
+    headers, body = request(url, pool)
+    assert body == "hello"
+    assert (
+        test.socket.last_request(url)
+        == b"GET /a HTTP/1.1\r\nHost: keepalive.test\r\n"
+        + b"Connection: keep-alive\r\n\r\n"
+    )
+    headers, body = request(url, pool)
+    assert body == "hello"
+    assert test.socket.Connects == connects + 1
+
+    url = "http://keepalive.test/close"
+    test.socket.respond(
+        url,
+        b"HTTP/1.1 200 OK\r\nConnection: close\r\nContent-Length: 2\r\n\r\nhi",
+    )
+    request(url, pool)
+    request(url, pool)
+    assert test.socket.Connects == connects + 2
+
+    url = "https://keepalive.test/b"
+    test.socket.respond(url, b"HTTP/1.0 200 OK\r\n\r\nno length")
+    headers, body = request(url, pool)
+    assert body == "no length"
+    assert pool.open[("https", "keepalive.test", 443)] == 0
+
+
+def test_connection_pool_limits() -> None:
+    pool = ConnectionPool(max_per_host=1, idle_timeout=60.0)
+    url = "http://limits.test/"
+    test.socket.respond(url, b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n")
+    connects = test.socket.Connects
+    request(url, pool)
+    conn = pool.acquire("http", "limits.test", 80)
+    assert test.socket.Connects == connects + 1
+    assert pool.open[("http", "limits.test", 80)] == 1
+    pool.release(conn)
+    conn.last_used -= 120
+    pool.expire()
+    assert pool.open[("http", "limits.test", 80)] == 0
+
+    # A body that cannot be read gives the connection back to the pool.
+    for url, head in [
+        ("http://limits.test/gzip", b"Transfer-Encoding: gzip\r\n"),
+        ("http://limits.test/length", b"Content-Length: many\r\n"),
+    ]:
+        test.socket.respond(url, b"HTTP/1.1 200 OK\r\n" + head + b"\r\n")
+        assert test.errors(request, url, pool)
+    assert pool.open[("http", "limits.test", 80)] == 0
+
+    # So does a body that is dropped before it is read.
+    headers, chunks = stream_bytes("http://limits.test/", pool)
+    assert pool.open[("http", "limits.test", 80)] == 1
+    del chunks
+    assert pool.open[("http", "limits.test", 80)] == 0
+    headers, chunks = stream_bytes("http://limits.test/", pool)
+    chunks.close()
+    assert request("http://limits.test/", pool)[1] == ""
+
+
+def test_session_tickets() -> None:
+    pool = ConnectionPool()
+    origin = ("https", "tickets.test", 443)
+    conn = pool.acquire(*origin)
+    conn.socket.session = mock.Mock(has_ticket=False)
+    pool.release(conn)
+    assert origin not in pool.sessions
+
+    # The ticket arrives after the handshake, so it is kept on release.
+    conn = pool.acquire(*origin)
+    conn.socket.session = session = mock.Mock(has_ticket=True)
+    pool.release(conn)
+    assert pool.sessions[origin] is session
+    first = pool.acquire(*origin)
+    second = pool.acquire(*origin)
+    assert first is conn and second.socket.offered_session is session
+
+
+def test_chunked() -> None:
+    url = "http://test.test/chunked"
+    test.socket.respond(
+        url,
+        b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+        + b"5\r\nHello\r\n7;ext=1\r\n, world\r\n0\r\nTrailer: x\r\n\r\n",
+    )
+    headers, body = request(url)
+    assert body == "Hello, world"
+
+    pool = ConnectionPool()
+    connects = test.socket.Connects
+    headers, body = request(url, pool)
+    assert body == "Hello, world"
+    headers, body = request(url, pool)
+    assert body == "Hello, world"
+    assert test.socket.Connects == connects + 1
+
+
+def test_content_encoding() -> None:
+    text = "<p>compressed</p>" * 100
+
+    url = "http://test.test/gzip"
+    data = gzip.compress(text.encode("utf8"))
+    test.socket.respond(
+        url, b"HTTP/1.0 200 OK\r\nContent-Encoding: gzip\r\n\r\n" + data
+    )
+    headers, body = request(url, accept_encoding=True)
+    assert body == text
+    assert (
+        test.socket.last_request(url)
+        == b"GET /gzip HTTP/1.0\r\nHost: test.test\r\n"
+        + b"Accept-Encoding: gzip, deflate\r\n\r\n"
+    )
+
+    url = "http://test.test/deflate"
+    data = zlib.compress(text.encode("utf8"))
+    test.socket.respond(
+        url, b"HTTP/1.0 200 OK\r\nContent-Encoding: deflate\r\n\r\n" + data
+    )
+    headers, body = request(url, accept_encoding=True)
+    assert body == text
+
+    url = "http://test.test/raw-deflate"
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    data = compressor.compress(text.encode("utf8")) + compressor.flush()
+    test.socket.respond(
+        url, b"HTTP/1.0 200 OK\r\nContent-Encoding: deflate\r\n\r\n" + data
+    )
+    headers, body = request(url, accept_encoding=True)
+    assert body == text
+    # Too little of the body to tell raw deflate apart in the first read.
+    headers, chunks = stream_bytes(url, accept_encoding=True, chunk_size=1)
+    assert b"".join(chunks) == text.encode("utf8")
+
+    url = "http://test.test/chunked-gzip"
+    data = gzip.compress(text.encode("utf8"))
+    chunks = b"".join(
+        "{:x}\r\n".format(len(data[i : i + 10])).encode("utf8")
+        + data[i : i + 10]
+        + b"\r\n"
+        for i in range(0, len(data), 10)
+    )
+    test.socket.respond(
+        url,
+        b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n"
+        + b"Content-Encoding: gzip\r\n\r\n"
+        + chunks
+        + b"0\r\n\r\n",
+    )
+    headers, body = request(url, ConnectionPool(), accept_encoding=True)
+    assert body == text
+
+
+def test_stream() -> None:
+    url = "http://test.test/stream"
+    text = "café " * 10
+    data = text.encode("utf8")
+    test.socket.respond(
+        url,
+        b"HTTP/1.1 200 OK\r\nContent-Length: "
+        + str(len(data)).encode("utf8")
+        + b"\r\n\r\n"
+        + data,
+    )
+    headers, chunks = stream_bytes(url, chunk_size=4)
+    assert headers == {"content-length": str(len(data))}
+    pieces = list(chunks)
+    assert all(len(piece) <= 4 for piece in pieces)
+    assert b"".join(pieces) == data
+
+    headers, text_chunks = stream(url, chunk_size=4)
+    assert "".join(text_chunks) == text
+
+    pool = ConnectionPool()
+    origin = ("http", "test.test", 80)
+    headers, chunks = stream_bytes(url, pool, chunk_size=4)
+    next(chunks)
+    assert pool.open[origin] == 1
+    chunks.close()
+    assert pool.open[origin] == 0
+
+    headers, chunks = stream_bytes(url, pool, chunk_size=4)
+    assert pool.idle.get(origin, []) == []
+    list(chunks)
+    assert len(pool.idle[origin]) == 1
+
+
+def test_choose_charset() -> None:
+    html = {"content-type": "text/html"}
+    assert choose_charset(html, b"<p>hi</p>") == "utf-8"
+    latin = {"content-type": 'text/html; Charset="ISO-8859-1"'}
+    assert choose_charset(latin, b"<p>hi</p>") == "iso8859-1"
+    assert choose_charset(html, b'<head><meta charset="windows-1252">') == "cp1252"
+    meta = b'<meta http-equiv="Content-Type" content="text/html; charset=koi8-r">'
+    assert choose_charset(html, meta) == "koi8-r"
+    assert choose_charset(latin, meta) == "iso8859-1"
+    assert choose_charset(latin, b"\xef\xbb\xbf<p>") == "utf-8-sig"
+    assert choose_charset({"content-type": "text/html; charset=bogus"}, meta) == (
+        "koi8-r"
+    )
+    late = b" " * 2000 + b'<meta charset="koi8-r">'
+    assert choose_charset(html, late) == "utf-8"
+
+
+def test_charset_decoding() -> None:
+    text = "naïve café"
+    url = "http://test.test/latin1"
+    test.socket.respond(
+        url,
+        b"HTTP/1.0 200 OK\r\nContent-Type: text/html; charset=iso-8859-1\r\n\r\n"
+        + text.encode("latin1"),
+    )
+    headers, body = request(url)
+    assert body == text
+    assert request_bytes(url)[1] == text.encode("latin1")
+
+    url = "http://test.test/meta"
+    data = ('<meta charset="cp1251"><p>' + " " * 2000 + "привет</p>").encode("cp1251")
+    test.socket.respond(url, b"HTTP/1.0 200 OK\r\n\r\n" + data)
+    headers, chunks = stream(url, chunk_size=16)
+    assert "".join(chunks).endswith("привет</p>")
+    assert request(url)[1].endswith("привет</p>")
+
+    assert decode_body({}, b"caf\xe9 ok") == "caf\ufffd ok"
+
+
+def test_resolver() -> None:
+    lookups = []
+
+    def getaddrinfo(host, port, type=0):
+        lookups.append(host)
+        v4 = (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("192.0.2.1", port))
+        v6 = (socket.AF_INET6, socket.SOCK_STREAM, 6, "", ("2001:db8::1", port, 0, 0))
+        return [v6, v4, v4]
+
+    resolver = Resolver(ttl=60, getaddrinfo=getaddrinfo)
+    addresses = resolver.resolve("example.test", 80)
+    assert addresses == [
+        (socket.AF_INET6, ("2001:db8::1", 80, 0, 0)),
+        (socket.AF_INET, ("192.0.2.1", 80)),
+    ]
+    assert resolver.resolve("example.test", 80) == addresses
+    assert lookups == ["example.test"]
+
+    resolver.clear()
+    resolver.resolve("example.test", 80)
+    assert len(lookups) == 2
+    resolver.ttl = 0
+    resolver.clear()
+    resolver.resolve("example.test", 80)
+    resolver.resolve("example.test", 80)
+    assert len(lookups) == 4
+
+
+class RacingSocket:
+    # Connects according to the address: "fast" at once, "slow" after
+    # 0.2s, "refused" fails at once and "dead" never answers.
+    opened = []
+
+    def __init__(self, family, type, proto):
+        self.family = family
+        self.timeout = None
+        self.closed = threading.Event()
+        RacingSocket.opened.append(self)
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def connect(self, address):
+        self.address = address[0]
+        if address[0] == "refused":
+            raise ConnectionRefusedError()
+        if address[0] == "slow":
+            time.sleep(0.2)
+        if address[0] == "dead":
+            if not self.closed.wait(self.timeout):
+                raise socket.timeout()
+            raise OSError("closed")
+
+    def close(self):
+        self.closed.set()
+
+
+def race(*hosts, timeout=5.0):
+    infos = [
+        (family, socket.SOCK_STREAM, 6, "", (host, 80))
+        for family, host in zip([socket.AF_INET6, socket.AF_INET] * 3, hosts)
+    ]
+    resolver = Resolver(getaddrinfo=lambda host, port, type=0: infos)
+    RacingSocket.opened = []
+    start = time.monotonic()
+    with mock.patch("socket.socket", RacingSocket):
+        try:
+            s = create_connection("race.test", 80, timeout, 0.05, resolver)
+        finally:
+            elapsed = time.monotonic() - start
+    return s, elapsed
+
+
+def test_happy_eyeballs() -> None:
+    s, elapsed = race("dead", "fast")
+    assert s.address == "fast" and s.timeout is None
+    assert 0.05 <= elapsed < 1
+    assert [sock.address for sock in RacingSocket.opened] == ["dead", "fast"]
+
+    s, elapsed = race("refused", "slow", "fast")
+    assert s.address == "fast"
+    assert elapsed < 0.2
+
+    s, elapsed = race("slow", "dead")
+    assert s.address == "slow"
+    assert not s.closed.is_set()
+    assert RacingSocket.opened[1].closed.is_set()
+
+    with pytest.raises(ConnectionRefusedError):
+        race("refused", "refused")
+
+    with pytest.raises(TimeoutError):
+        race("dead", "dead", timeout=0.3)
+    assert all(sock.closed.is_set() for sock in RacingSocket.opened)
+
+
+def test_connect_options() -> None:
+    url = "http://test.test/options"
+    test.socket.respond_ok(url, "options")
+    resolver = Resolver()
+    with mock.patch("request.create_connection", wraps=create_connection) as connect:
+        assert request(url, connect_timeout=2.5, resolver=resolver)[1] == "options"
+    connect.assert_called_once_with("test.test", 80, 2.5, resolver=resolver)
+
+    # Without a timeout, the module default is read when connecting.
+    with mock.patch("request.CONNECT_TIMEOUT", 0.3):
+        with pytest.raises(TimeoutError):
+            race("dead", "dead", timeout=None)
@@ -0,0 +1,67 @@
+# mypy: ignore-errors
+
+import os
+import test  # noqa: F401
+
+import pytest
+
+from browser import DocumentLayout
+from font import MonospaceBackend, TkBackend, set_backend
+from html_parser import HTMLParser
+from snapshot import SnapshotCache, dumps, loads
+
+BODY = "<p>hello <b>wörld</b> <i>again</i> hello</p><pre>code  block</pre>" * 3
+
+
+def lay_out(body, width=800):
+    document = DocumentLayout(HTMLParser(body).parse(), width)
+    document.layout()
+    display_list = []
+    document.paint(display_list)
+    return document.height, display_list
+
+
+def test_round_trip() -> None:
+    height, display_list = lay_out(BODY)
+    data = dumps(height, display_list)
+    loaded_height, loaded = loads(data)
+    assert loaded_height == height
+    assert repr(loaded) == repr(display_list)
+    assert loaded[1].font is display_list[1].font
+
+    with pytest.raises(AssertionError):
+        loads(b"XXXX" + data[4:])
+    with pytest.raises(AssertionError):
+        loads(data + b"\0")
+
+
+def test_snapshot_cache(tmp_path) -> None:
+    cache = SnapshotCache(str(tmp_path))
+    assert cache.load(BODY, 800) is None
+    height, display_list = lay_out(BODY)
+    cache.store(BODY, 800, height, display_list)
+
+    loaded_height, loaded = cache.load(BODY, 800)
+    assert (loaded_height, repr(loaded)) == (height, repr(display_list))
+    assert cache.load(BODY + " ", 800) is None
+    assert cache.load(BODY, 400) is None
+    try:
+        set_backend(MonospaceBackend())
+        assert cache.load(BODY, 800) is None
+    finally:
+        set_backend(TkBackend())
+    assert (cache.hits, cache.misses) == (1, 4)
+
+
+def test_small_fonts(tmp_path) -> None:
+    body = "<small>" * 9 + "tiny"
+    height, display_list = lay_out(body)
+    assert display_list[0].font.key[0] < 0
+    assert repr(loads(dumps(height, display_list))[1]) == repr(display_list)
+
+    # A snapshot that cannot be written is skipped.
+    cache = SnapshotCache(str(tmp_path / "missing"))
+    os.rmdir(cache.directory)
+    cache.store(body, 800, height, display_list)
+    assert cache.failed == 1
+    assert cache.load(body, 800) is None